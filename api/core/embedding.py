@@ -0,0 +1,170 @@
+"""
+core/embedding.py – EmbeddingBatcher + OnnxEmbedder.
+Trách nhiệm: gom các query đến gần nhau thành 1 batch encode (micro-batching),
+cache LRU vector của query đã encode, và backend ONNX int8 (tùy chọn).
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 32        # số query tối đa trong 1 forward pass
+BATCH_WINDOW = 0.01   # giây chờ gom thêm query sau query đầu tiên
+CACHE_SIZE   = 2048   # số query gần nhất giữ vector trong RAM
+ONNX_FILE    = "model.int8.onnx"   # do export_onnx.py tạo ra
+ONNX_THREADS = 4
+
+
+class EmbeddingBatcher:
+    """Coalesce các lời gọi encode đồng thời → 1 `model.encode([...])`.
+
+    Mỗi caller nhận về 1 Future; worker nền gom query trong BATCH_WINDOW
+    rồi encode 1 lần trong thread pool và trả kết quả cho từng Future.
+    """
+
+    def __init__(
+        self,
+        model_getter: Callable[[], SentenceTransformer],
+        max_batch: int = MAX_BATCH,
+        window: float = BATCH_WINDOW,
+        executor: Optional[Executor] = None,
+        cache_size: int = CACHE_SIZE,
+    ) -> None:
+        self._get_model = model_getter
+        self._executor  = executor
+        self._max_batch = max_batch
+        self._window    = window
+        # Chỉ truy cập trên event loop → không cần lock
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._cache_size = cache_size
+        self._pinned: dict[str, np.ndarray] = {}   # query cố định (warm lúc startup), không bị evict
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ── Public API ─────────────────────────────────────────────────────────────
+
+    async def encode(self, query: str) -> np.ndarray:
+        """Trả về vector (đã normalize) của `query`, encode chung batch với query khác."""
+        vec = self._pinned.get(query)
+        if vec is not None:
+            return vec
+        vec = self._cache.get(query)
+        if vec is not None:
+            self._cache.move_to_end(query)
+            return vec
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        await self._queue.put((query, fut))
+        vec = await fut
+        self._cache[query] = vec
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return vec
+
+    def warm(self, queries: list[str]) -> None:
+        """Encode đồng bộ (gọi lúc startup) và ghim vector của các query cố định."""
+        queries = [q for q in dict.fromkeys(queries) if q and q not in self._pinned]
+        if not queries:
+            return
+        vecs = self._encode_batch([f"query: {q}" for q in queries])
+        self._pinned.update(zip(queries, vecs))
+
+    # ── Private helpers ────────────────────────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        """Khởi tạo queue + worker trên loop hiện tại (lazy, tạo lại nếu loop đổi)."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop   = loop
+            self._queue  = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            texts = [f"query: {q}" for q, _ in batch]
+            try:
+                vecs = await self._loop.run_in_executor(self._executor, self._encode_batch, texts)
+            except Exception as e:
+                logger.error(f"EmbeddingBatcher encode error: {e}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(batch, vecs):
+                if not fut.done():      # caller có thể đã cancel
+                    fut.set_result(vec)
+
+    async def _collect(self) -> list[tuple[str, asyncio.Future]]:
+        """Chờ query đầu tiên, sau đó gom thêm tới max_batch hoặc hết window."""
+        batch    = [await self._queue.get()]
+        deadline = self._loop.time() + self._window
+        while len(batch) < self._max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        return self._get_model().encode(
+            texts, normalize_embeddings=True, batch_size=self._max_batch, show_progress_bar=False
+        )
+
+
+class OnnxEmbedder:
+    """Encode bằng ONNX Runtime (model int8) – cùng interface `encode()` với SentenceTransformer.
+
+    `model_dir` chứa ONNX_FILE + tokenizer (xem export_onnx.py). Mean pooling
+    + L2 normalize giống pipeline sentence-transformers của e5 → vector tương
+    thích với FAISS index hiện có.
+    """
+
+    def __init__(self, model_dir: str | Path, threads: int = ONNX_THREADS) -> None:
+        import onnxruntime as ort                      # optional dependency
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        self._session   = ort.InferenceSession(
+            str(model_dir / ONNX_FILE), sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self._inputs    = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+
+    def encode(
+        self,
+        texts: list[str],
+        normalize_embeddings: bool = True,
+        batch_size: int = MAX_BATCH,
+        **_: object,
+    ) -> np.ndarray:
+        out = [self._encode_chunk(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        vecs = np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(vecs):
+            vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+        return vecs
+
+    def _encode_chunk(self, texts: list[str]) -> np.ndarray:
+        enc = self._tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="np")
+        feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self._inputs}
+        hidden = self._session.run(None, feed)[0]
+        return self._mean_pool(hidden, enc["attention_mask"])
+
+    @staticmethod
+    def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Trung bình token embedding, bỏ qua padding (attention_mask = 0)."""
+        m = mask[..., None].astype(np.float32)
+        return ((hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)).astype(np.float32)
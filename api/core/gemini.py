@@ -3,15 +3,13 @@ core/gemini.py – GeminiService class.
 Trách nhiệm: giao tiếp với Google Gemini API (REST + streaming).
 """
 import logging
-import threading
-from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 from typing import AsyncIterator, Optional
-from datetime import datetime
 
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 
-from .router import ModelTier
+from .router import ModelTier, QueryRouter, current_hour
 from .prompt import PromptBuilder
 from ..models import FoodItem
 
@@ -25,6 +23,8 @@ _MAX_TOKENS: dict[ModelTier, int] = {
     "gemini-flash": 800,
     "gemini-pro":   1500,
 }
+_FLUSH_INTERVAL = 0.02  # giây – gom chunk stream trước khi yield
+_FLUSH_CHARS    = 64    # flush sớm khi buffer đủ dài
 
 
 class GeminiService:
@@ -33,6 +33,8 @@ class GeminiService:
     def __init__(self, api_key: str, prompt_builder: PromptBuilder) -> None:
         genai.configure(api_key=api_key)
         self._pb = prompt_builder
+        # Pool riêng cho stream worker (SDK stream là iterator blocking)
+        self._io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini")
 
     # ── Public API ─────────────────────────────────────────────────────────────
 
@@ -46,20 +48,34 @@ class GeminiService:
         food_context: list[FoodItem] | None = None,
         user_address: Optional[str] = None,
     ) -> str:
-        """Gọi Gemini REST, trả về full text."""
-        import asyncio
+        """Gọi Gemini REST (async SDK, không chiếm thread), trả về full text."""
         system, gemini_hist, cfg = self._build_params(
             tier, city, max_tokens, history, food_context, user_address
         )
-        def _call():
-            model = self._build_model(tier, system, cfg)
-            return model.start_chat(history=gemini_hist).send_message(message).text
         try:
-            return await asyncio.get_event_loop().run_in_executor(None, _call)
+            model = self._build_model(tier, system, cfg)
+            resp  = await model.start_chat(history=gemini_hist).send_message_async(message)
+            return resp.text
         except Exception as e:
             logger.error(f"Gemini.chat error: {e}")
             return f"Xin lỗi, AI đang gặp sự cố. ({type(e).__name__})"
 
+    async def chat_many(
+        self,
+        messages: list[str],
+        city: str,
+        tier: ModelTier,
+        max_tokens: int,
+        food_context: list[FoodItem] | None = None,
+        user_address: Optional[str] = None,
+    ) -> list[str]:
+        """Gửi nhiều message độc lập song song (không history), giữ đúng thứ tự."""
+        import asyncio
+        return list(await asyncio.gather(*(
+            self.chat(m, city, tier, max_tokens, None, food_context, user_address)
+            for m in messages
+        )))
+
     async def stream(
         self,
         message: str,
@@ -70,36 +86,56 @@ class GeminiService:
         food_context: list[FoodItem] | None = None,
         user_address: Optional[str] = None,
     ) -> AsyncIterator[str]:
-        """Streaming Gemini – dùng threading.Thread + Queue cho WebSocket."""
+        """Streaming Gemini – worker (io pool) đẩy chunk vào asyncio.Queue qua call_soon_threadsafe.
+        Chunk nhỏ được gom lại, flush mỗi _FLUSH_INTERVAL giây hoặc khi đủ _FLUSH_CHARS ký tự.
+        """
         import asyncio
         system, gemini_hist, cfg = self._build_params(
             tier, city, max_tokens, history, food_context, user_address
         )
-        queue: Queue = Queue()
+        loop  = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
         DONE = object()
 
+        def _put(item) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
         def _worker():
             try:
                 model = self._build_model(tier, system, cfg)
                 chat  = model.start_chat(history=gemini_hist)
                 for chunk in chat.send_message(message, stream=True):
                     if chunk.text:
-                        queue.put(chunk.text)
+                        _put(chunk.text)
             except Exception as e:
                 logger.error(f"Gemini.stream error: {e}")
-                queue.put(f"\n[Lỗi: {type(e).__name__}]")
+                _put(f"\n[Lỗi: {type(e).__name__}]")
             finally:
-                queue.put(DONE)
+                _put(DONE)
 
-        threading.Thread(target=_worker, daemon=True).start()
+        self._io_pool.submit(_worker)
+        buf: list[str] = []
+        size, last_flush = 0, loop.time()
         while True:
-            try:
-                item = queue.get_nowait()
-                if item is DONE:
-                    break
-                yield item
-            except Empty:
-                await asyncio.sleep(0.05)
+            if not buf:
+                item = await queue.get()
+            else:
+                try:
+                    timeout = max(_FLUSH_INTERVAL - (loop.time() - last_flush), 0)
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = None
+            if item is DONE:
+                break
+            if item is not None:
+                buf.append(item)
+                size += len(item)
+            if item is None or size >= _FLUSH_CHARS:
+                yield "".join(buf)
+                buf.clear()
+                size, last_flush = 0, loop.time()
+        if buf:
+            yield "".join(buf)
 
     async def rank_nearby(
         self,
@@ -117,14 +153,19 @@ class GeminiService:
     # ── Private helpers ────────────────────────────────────────────────────────
 
     def _build_params(self, tier, city, max_tokens, history, food_ctx, user_address):
-        hour    = datetime.now().hour
-        meal    = PromptBuilder().trim_history.__doc__ and ""  # unused
-        from .router import QueryRouter
+        """system_instruction chỉ chứa phần bất biến; giờ/địa chỉ/food context
+        đi vào cặp turn user/model đầu history để prefix giữa các request trùng nhau."""
+        hour    = current_hour()
         meal    = QueryRouter.get_meal_time(hour)
-        system  = self._pb.build_system(tier, city, hour, meal, user_address)
+        system  = self._pb.build_system_stable(tier, city)
+        preamble = self._pb.build_dynamic_preamble(hour, meal, user_address)
         if food_ctx:
-            system += "\n\n" + self._pb.build_food_context(food_ctx)
-        hist    = self._pb.build_history(history or [])
+            preamble += "\n\n" + self._pb.build_food_context(food_ctx)
+        hist    = [
+            {"role": "user",  "parts": [{"text": preamble}]},
+            {"role": "model", "parts": [{"text": "OK"}]},
+            *self._pb.build_history(history or []),
+        ]
         tokens  = min(max_tokens, _MAX_TOKENS[tier])
         cfg     = GenerationConfig(max_output_tokens=tokens)
         return system, hist, cfg
@@ -2,6 +2,7 @@
 core/prompt.py – PromptBuilder class.
 Trách nhiệm: xây dựng system prompt và context cho Gemini.
 """
+from functools import lru_cache
 from typing import Optional
 from ..models import FoodItem
 from .router import ModelTier
@@ -9,35 +10,41 @@ from .router import ModelTier
 MAX_HISTORY_TURNS = 6  # BR4: giữ tối đa 6 turn
 
 
+@lru_cache(maxsize=64)
+def _build_system_stable_cached(tier: ModelTier, city: str) -> str:
+    """Phần system prompt bất biến theo (tier, city) – giữ nguyên prefix để Gemini cache."""
+    if tier == "local":
+        return f"AI ẩm thực – {city}."
+    if tier == "gemini-flash":
+        return (
+            f"Bạn là trợ lý ẩm thực AI cho {city}. "
+            "Trả lời ngắn gọn, chính xác, tiếng Việt."
+        )
+    return (
+        f"Bạn là chuyên gia ẩm thực AI cho {city}.\n"
+        "Tư vấn món ăn, tìm quán gần user, gợi ý phù hợp.\n"
+        "Luôn trả lời tiếng Việt, thân thiện, cụ thể."
+    )
+
+
 class PromptBuilder:
     """Xây dựng prompts cho Gemini API."""
 
     # ── System prompt ──────────────────────────────────────────────────────────
 
-    def build_system(
+    def build_system_stable(self, tier: ModelTier, city: str) -> str:
+        """System prompt không chứa giờ/địa chỉ (cache theo tier + city)."""
+        return _build_system_stable_cached(tier, city)
+
+    def build_dynamic_preamble(
         self,
-        tier: ModelTier,
-        city: str,
         hour: int,
         meal_time: str,
         user_address: Optional[str] = None,
     ) -> str:
-        """Trả về system prompt phù hợp với tier."""
+        """Phần thay đổi theo request (giờ, bữa, địa chỉ) – gửi như turn user đầu tiên."""
         loc = f"User ở: {user_address}." if user_address else "Không có địa chỉ."
-        if tier == "local":
-            return f"AI ẩm thực – {city} – {hour}h ({meal_time})."
-        if tier == "gemini-flash":
-            return (
-                f"Bạn là trợ lý ẩm thực AI cho {city}. "
-                f"Hiện tại: {hour}h ({meal_time}). {loc} "
-                "Trả lời ngắn gọn, chính xác, tiếng Việt."
-            )
-        return (
-            f"Bạn là chuyên gia ẩm thực AI cho {city}.\n"
-            f"Thời gian: {hour}h ({meal_time}). {loc}\n"
-            "Tư vấn món ăn, tìm quán gần user, gợi ý phù hợp.\n"
-            "Luôn trả lời tiếng Việt, thân thiện, cụ thể."
-        )
+        return f"Hiện tại: {hour}h ({meal_time}). {loc}"
 
     # ── Food context ───────────────────────────────────────────────────────────
 
@@ -4,7 +4,9 @@ Phân loại query và quyết định model AI phù hợp.
 Trách nhiệm: phân loại ONLY – không gọi AI, không search.
 """
 import re
+import time
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Literal
 
 ModelTier = Literal["local", "gemini-flash", "gemini-pro"]
@@ -45,8 +47,33 @@ HEAVY_PATTERNS = [
     r"(k[eế] ho[aạ]ch|l[iị]ch).+([aă]n|b[uữ]a).+(c[aả] ng[aà]y|h[oô]m nay)",
 ]
 
+LOCATION_PATTERN = r"g[aầ]n|xung quanh|khu v[uự]c|gan|nearby"
 
-@dataclass
+
+# ── Giờ hiện tại (cache ngắn) ─────────────────────────────────────────────────
+
+HOUR_CACHE_SECONDS = 60
+_hour_cache = {"t": 0.0, "h": 0}
+
+
+def current_hour() -> int:
+    """Giờ local hiện tại, tính lại tối đa 1 lần / HOUR_CACHE_SECONDS (đọc stale vài giây là chấp nhận được)."""
+    now = time.time()
+    if now - _hour_cache["t"] > HOUR_CACHE_SECONDS:
+        _hour_cache["h"] = time.localtime(now).tm_hour
+        _hour_cache["t"] = now
+    return _hour_cache["h"]
+
+
+def _union(patterns: list[str]) -> re.Pattern:
+    """Gộp list pattern thành 1 alternation → 1 lần scan ở tầng C thay vì N lần search."""
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.I)
+
+
+ROUTE_CACHE_SIZE = 8192   # số (query chuẩn hoá, has_location) giữ kết quả route
+
+
+@dataclass(frozen=True)
 class RouteDecision:
     model: ModelTier
     max_output_tokens: int
@@ -58,22 +85,24 @@ class QueryRouter:
     """Phân loại query → chọn model tier phù hợp."""
 
     def __init__(self) -> None:
-        self._simple  = [re.compile(p, re.I) for p in SIMPLE_PATTERNS]
-        self._complex = [re.compile(p, re.I) for p in COMPLEX_PATTERNS]
-        self._heavy   = [re.compile(p, re.I) for p in HEAVY_PATTERNS]
+        self._simple_re   = _union(SIMPLE_PATTERNS)
+        self._complex_re  = _union(COMPLEX_PATTERNS)
+        self._heavy_re    = _union(HEAVY_PATTERNS)
+        self._location_re = re.compile(LOCATION_PATTERN, re.I)
+        # LRU theo instance: route() thuần tuý theo input, RouteDecision frozen → trả chung an toàn
+        self._route_cached = lru_cache(maxsize=ROUTE_CACHE_SIZE)(self._route)
 
     # ── Public ─────────────────────────────────────────────────────────────────
 
     def route(self, query: str, has_location: bool = False) -> RouteDecision:
-        """Phân tích query và trả về RouteDecision."""
-        q = query.strip()
-        if self._is_heavy(q):
-            return RouteDecision("gemini-pro", 1500, "heavy", "Query phức tạp nhiều tầng")
-        if self._is_complex(q, has_location):
-            return RouteDecision("gemini-flash", 800, "complex", "Query location/time/đa điều kiện")
-        return RouteDecision("local", 256, "simple", "Simple – dùng template")
+        """Phân tích query và trả về RouteDecision (cache theo query đã chuẩn hoá)."""
+        return self._route_cached(query.strip().lower(), has_location)
+
+    def cache_clear(self) -> None:
+        self._route_cached.cache_clear()
 
     @staticmethod
+    @lru_cache(maxsize=24)
     def get_meal_time(hour: int) -> str:
         """Trả về tên bữa ăn theo giờ."""
         if 6  <= hour < 10: return "Bữa sáng"
@@ -84,12 +113,20 @@ class QueryRouter:
 
     # ── Private ────────────────────────────────────────────────────────────────
 
+    def _route(self, q: str, has_location: bool) -> RouteDecision:
+        if self._is_heavy(q):
+            return RouteDecision("gemini-pro", 1500, "heavy", "Query phức tạp nhiều tầng")
+        if self._is_complex(q, has_location):
+            return RouteDecision("gemini-flash", 800, "complex", "Query location/time/đa điều kiện")
+        return RouteDecision("local", 256, "simple", "Simple – dùng template")
+
     def _is_heavy(self, q: str) -> bool:
-        return len(q) > 200 or any(p.search(q) for p in self._heavy)
+        return len(q) > 200 or self._match(self._heavy_re, q)
 
     def _is_complex(self, q: str, has_location: bool) -> bool:
-        location_hit = has_location and re.search(r"g[aầ]n|xung quanh|khu v[uự]c|gan|nearby", q, re.I)
-        return bool(location_hit) or any(p.search(q) for p in self._complex) or len(q) > 100
+        location_hit = has_location and self._match(self._location_re, q)
+        return location_hit or self._match(self._complex_re, q) or len(q) > 100
 
-    def _match(self, patterns: list, q: str) -> bool:
-        return any(p.search(q) for p in patterns)
+    @staticmethod
+    def _match(pattern: re.Pattern, q: str) -> bool:
+        return pattern.search(q) is not None
@@ -6,35 +6,115 @@ Tất cả I/O SQLite đi qua SQLAlchemy Session (không còn raw sqlite3).
 Blocking calls được wrap trong run_in_executor để không block event loop.
 """
 import asyncio
+import contextlib
+import functools
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Iterable, Optional
 
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
-from sqlalchemy import func, case, text
+from sqlalchemy import Row, func, case, select, text, update
 from sqlalchemy.orm import Session
 
+from .embedding import EmbeddingBatcher, OnnxEmbedder
+from ..db.fts import FTS_MIN_CHARS, RANK_SQL, SEARCH_SQL, ensure_fts, match_query, union_rank_sql
 from ..db.models import Food
-from ..db.session import db_session
+from ..db.session import DB_WORKERS, ML_WORKERS, db_session, preload_engines
 from ..models import FoodItem
 
 logger = logging.getLogger(__name__)
 
 VALID_CITIES = {"ha_noi", "ho_chi_minh", "da_nang", "hai_phong", "ha_long", "thanh_hoa"}
 
+# Thứ tự ưu tiên file index trong mỗi city pack (bản nén do quantize_faiss.py build)
+INDEX_FILES    = (
+    "index_hnsw_sq8.faiss", "index_ivfpq.faiss", "index_sq8.faiss", "index_hnsw.faiss", "index.faiss",
+)
+HNSW_EF_SEARCH = 64
+IVF_NPROBE     = 8
+# 1 query / lần search: song song hoá giữa các request (thread pool) thay vì OpenMP trong FAISS
+FAISS_OMP_THREADS = int(os.getenv("FAISS_OMP_THREADS", "1"))
+# Thread intra-op của torch (0 = giữ mặc định); đặt 1 khi concurrency đến từ thread pool
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+# mmap: page cache của OS giữ index (chia sẻ/evict được) thay vì copy vào heap
+FAISS_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+# TTL (giây) cho cache city insights phụ thuộc so_lan_click
+INSIGHTS_TTL        = 30
+CLICK_DEPENDENT     = ("top_clicks", "trending")
+# Aggregate không phụ thuộc click – chỉ đổi khi reload data pack → tính 1 lần lúc preload
+STATIC_AGGREGATES   = ("district_stats", "price_distribution", "category_stats")
+
+# Cột cần cho FoodItem – search hot path select tuple thay vì ORM object
+ITEM_COLUMNS = (
+    Food.id, Food.ten_quan, Food.ten_mon, Food.dia_chi, Food.quan,
+    Food.thanh_pho, Food.gia_min, Food.gia_max, Food.note,
+)
+RANDOM_POOL_TTL     = 300   # cache (id, quận/địa chỉ, giá) cả bảng cho random discovery
+
+
+def ttl_cache(ttl: float):
+    """Cache kết quả coroutine method theo (tên hàm, city, *args, **kwargs) trong `self._insights_cache`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, city: str, *args, **kwargs):
+            key = (fn.__name__, city, *args, tuple(sorted(kwargs.items())))
+            hit = self._insights_cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < ttl:
+                return hit[1]
+            result = await fn(self, city, *args, **kwargs)
+            self._insights_cache[key] = (time.monotonic(), result)
+            return result
+        return wrapper
+    return decorator
+
+
+def static_cache(fn):
+    """Cache vĩnh viễn kết quả coroutine method theo (tên hàm, city) trong `self._aggregates`.
+    preload_all điền sẵn; city chưa preload thì tính lần đầu gọi.
+    """
+    @functools.wraps(fn)
+    async def wrapper(self, city: str):
+        key = (fn.__name__, city)
+        hit = self._aggregates.get(key)
+        if hit is None:
+            hit = self._aggregates[key] = await fn(self, city)
+        return hit
+    return wrapper
+
 
 class SearchService:
     """Hybrid search: ưu tiên text match (BR5), bổ sung semantic FAISS.
     Dùng SQLAlchemy ORM – không có raw SQL f-string.
     """
 
-    def __init__(self, data_dir: str | Path, model_name: str = "intfloat/multilingual-e5-small") -> None:
+    def __init__(
+        self,
+        data_dir: str | Path,
+        model_name: str = "intfloat/multilingual-e5-small",
+        onnx_dir: str | Path | None = None,
+    ) -> None:
         self._data_dir   = Path(data_dir)
         self._model_name = model_name
-        self._model: Optional[SentenceTransformer] = None
+        self._onnx_dir   = Path(onnx_dir) if onnx_dir else None
+        self._model: Optional[SentenceTransformer | OnnxEmbedder] = None
         self._faiss_cache: dict[str, faiss.Index] = {}
+        self._model_lock = threading.Lock()   # tránh load model/index 2 lần khi nhiều thread cùng cold-start
+        self._faiss_lock = threading.Lock()
+        # Pool riêng: SQLite read nhẹ không bị embedding/FAISS (CPU nặng) chiếm chỗ
+        self._db_pool    = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+        self._ml_pool    = ThreadPoolExecutor(max_workers=ML_WORKERS, thread_name_prefix="ml")
+        self._batcher    = EmbeddingBatcher(self._get_model, executor=self._ml_pool)
+        self._insights_cache: dict[tuple, tuple[float, Any]] = {}
+        self._aggregates: dict[tuple[str, str], Any] = {}   # (tên aggregate, city) → kết quả
+        self._fts_cities: set[str] = set()   # city đã có food_fts (tạo lúc preload)
+        self._random_pools: dict[str, tuple[float, tuple[np.ndarray, ...]]] = {}
 
     # ── Public: Search ─────────────────────────────────────────────────────────
 
@@ -42,78 +122,131 @@ class SearchService:
         """SQLAlchemy LIKE search – fast, no AI needed."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_by_name, city, keyword, limit
+            self._db_pool, self._fetch_by_name, city, keyword, limit
+        )
+
+    async def fts_search(self, city: str, keyword: str, limit: int = 10) -> list[FoodItem]:
+        """FTS5 MATCH xếp theo bm25 – chỉ SQL, không embed.
+        Trả về [] nếu city chưa có food_fts hoặc keyword quá ngắn (caller tự fallback).
+        """
+        self._validate_city(city)
+        if city not in self._fts_cities or len(keyword.strip()) < FTS_MIN_CHARS:
+            return []
+        return await asyncio.get_event_loop().run_in_executor(
+            self._db_pool, self._fetch_fts, city, keyword, limit
+        )
+
+    async def fts_search_multi(self, city: str, keywords: list[str], per_limit: int = 5) -> list[list[FoodItem]]:
+        """Như fts_search cho nhiều keyword trong 1 query UNION ALL; trả về 1 list/keyword."""
+        self._validate_city(city)
+        if city not in self._fts_cities:
+            return [[] for _ in keywords]
+        return await asyncio.get_event_loop().run_in_executor(
+            self._db_pool, self._fetch_fts_multi, city, keywords, per_limit
         )
 
     async def semantic_search(self, city: str, query: str, top_k: int = 10) -> list[FoodItem]:
-        """FAISS vector search với multilingual-e5 embedding."""
+        """FAISS vector search với multilingual-e5 embedding (encode qua micro-batch)."""
         self._validate_city(city)
+        vec = await self._batcher.encode(query)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._run_faiss, city, query, top_k
+            self._ml_pool, self._run_faiss, city, vec, top_k
         )
 
     async def hybrid_search(self, city: str, query: str, top_k: int = 10) -> list[FoodItem]:
-        """Kết hợp text + semantic, dedup, text match ưu tiên (BR5)."""
+        """Kết hợp text + semantic, dedup, text match ưu tiên (BR5).
+        Semantic chạy song song nhưng bị hủy nếu text đã đủ top_k kết quả.
+        """
         self._validate_city(city)
-        sem, txt = await asyncio.gather(
-            self.semantic_search(city, query, top_k),
-            self.text_search(city, query, top_k // 2),
-        )
-        return self._merge(txt, sem, top_k)
+        sem_task = asyncio.create_task(self.semantic_search(city, query, top_k))
+        try:
+            txt = await self.text_search(city, query, top_k)
+        except BaseException:
+            await self._cancel(sem_task)
+            raise
+        if len(txt) >= top_k:
+            await self._cancel(sem_task)
+            return txt[:top_k]
+        return self._merge(txt, await sem_task, top_k)
+
+    @staticmethod
+    async def _cancel(task: asyncio.Task) -> None:
+        """Hủy task và chờ nó kết thúc – không để lỗi 'Task exception was never retrieved'."""
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
 
     # ── Public: Click ──────────────────────────────────────────────────────────
 
     async def increment_click(self, city: str, food_id: int) -> int:
         """Tăng so_lan_click +1 cho quán food_id. Trả về giá trị mới."""
         self._validate_city(city)
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self._do_increment, city, food_id
+        count = await asyncio.get_event_loop().run_in_executor(
+            self._db_pool, self._do_increment, city, food_id
         )
+        self._invalidate_insights(city)
+        return count
+
+    def _invalidate_insights(self, city: str) -> None:
+        """Xóa cache insights phụ thuộc click của `city`."""
+        stale = [k for k in self._insights_cache if k[1] == city and k[0] in CLICK_DEPENDENT]
+        for key in stale:
+            self._insights_cache.pop(key, None)
 
     def _do_increment(self, city: str, food_id: int) -> int:
+        """1 câu UPDATE … RETURNING nguyên tử – không SELECT trước, không mất click khi race."""
+        stmt = (
+            update(Food)
+            .where(Food.id == food_id)
+            .values(so_lan_click=func.coalesce(Food.so_lan_click, 0) + 1)
+            .returning(Food.so_lan_click)
+        )
         with db_session(city, self._data_dir) as session:
-            food = session.get(Food, food_id)
-            if food is None:
-                raise ValueError(f"Food id={food_id} not found in {city}")
-            food.so_lan_click = (food.so_lan_click or 0) + 1
-            session.flush()
-            return food.so_lan_click
+            new_count = session.execute(stmt).scalar_one_or_none()
+        if new_count is None:
+            raise ValueError(f"Food id={food_id} not found in {city}")
+        return new_count
 
     # ── Public: City Insights ──────────────────────────────────────────────────
 
+    @ttl_cache(INSIGHTS_TTL)
     async def top_clicks(self, city: str, limit: int = 10) -> list[dict]:
         """Top `limit` quán được click nhiều nhất."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_top_clicks, city, limit
+            self._db_pool, self._fetch_top_clicks, city, limit
         )
 
+    @static_cache
     async def district_stats(self, city: str) -> list[dict]:
         """Thống kê số lượng quán theo từng quận."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_district_stats, city
+            self._db_pool, self._fetch_district_stats, city
         )
 
+    @static_cache
     async def price_distribution(self, city: str) -> dict:
         """Phân bố giá 3 phân khúc: dưới 50k / 50k-150k / trên 150k."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_price_dist, city
+            self._db_pool, self._fetch_price_dist, city
         )
 
+    @static_cache
     async def category_stats(self, city: str) -> list[dict]:
         """Cơ cấu loại hình quán ăn theo thành phố."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_category_stats, city
+            self._db_pool, self._fetch_category_stats, city
         )
 
+    @ttl_cache(INSIGHTS_TTL)
     async def trending(self, city: str, limit: int = 10) -> list[dict]:
         """Top trending dựa trên so_lan_click (có rank)."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_trending, city, limit
+            self._db_pool, self._fetch_trending, city, limit
         )
 
     async def random_discovery(
@@ -125,20 +258,39 @@ class SearchService:
         """Random discovery có filter quận và giá."""
         self._validate_city(city)
         return await asyncio.get_event_loop().run_in_executor(
-            None, self._fetch_random, city, district, max_price, limit
+            self._db_pool, self._fetch_random, city, district, max_price, limit
         )
 
     # ── Public: System ─────────────────────────────────────────────────────────
 
-    def preload_all(self) -> None:
-        """Load tất cả FAISS indexes vào RAM khi startup (BR6)."""
-        for city in self.get_all_cities():
+    def preload_all(self, warm_queries: Iterable[str] = ()) -> None:
+        """Load tất cả FAISS indexes vào RAM khi startup (BR6) + warm SQLite engines.
+        `warm_queries`: query cố định (vd. keyword theo bữa) được encode + ghim sẵn.
+        """
+        cities = self.get_all_cities()
+        preload_engines(self._data_dir, cities)
+        try:
+            self._batcher.warm(list(warm_queries))
+        except Exception as e:
+            logger.warning(f"Could not warm query embeddings: {e}")
+        for city in cities:
+            # FAISS trước và tách riêng: DDL lỗi (pack read-only, ...) không được bỏ qua preload index
             try:
                 self._get_model()
+                self._prefetch_index(city)
                 self._load_faiss(city)
                 logger.info(f"Preloaded: {city}")
             except Exception as e:
                 logger.warning(f"Could not preload {city}: {e}")
+            try:
+                self._ensure_indexes(city)
+            except Exception as e:
+                logger.warning(f"Could not build indexes for {city}: {e}")
+            try:
+                self._precompute_aggregates(city)
+                self._random_pool(city)
+            except Exception as e:
+                logger.warning(f"Could not precompute insights for {city}: {e}")
 
     def get_all_cities(self) -> list[str]:
         if not self._data_dir.exists():
@@ -147,68 +299,181 @@ class SearchService:
 
     # ── Private: FAISS ─────────────────────────────────────────────────────────
 
-    def _run_faiss(self, city: str, query: str, top_k: int) -> list[FoodItem]:
-        model = self._get_model()
+    def _run_faiss(self, city: str, vec: np.ndarray, top_k: int) -> list[FoodItem]:
         index = self._load_faiss(city)
-        vec   = model.encode(f"query: {query}", normalize_embeddings=True)
         k     = min(top_k, index.ntotal)
-        _, indices = index.search(np.array([vec], dtype=np.float32), k)
-        ids = [int(i) + 1 for i in indices[0] if i >= 0]
+        # encode trả float32 C-contiguous → astype/ascontiguousarray là no-op, reshape là view
+        q = np.ascontiguousarray(vec.astype(np.float32, copy=False)).reshape(1, -1)
+        _, indices = index.search(q, k)
+        row = indices[0]
+        ids = (row[row >= 0].astype(np.int64) + 1).tolist()   # FAISS 0-based → DB id 1-based
         return self._fetch_by_ids(city, ids)
 
     def _load_faiss(self, city: str) -> faiss.Index:
-        if city not in self._faiss_cache:
-            path = self._data_dir / city / "index.faiss"
-            if not path.exists():
-                raise FileNotFoundError(f"FAISS not found: {path}")
-            self._faiss_cache[city] = faiss.read_index(str(path))
-        return self._faiss_cache[city]
-
-    def _get_model(self) -> SentenceTransformer:
+        index = self._faiss_cache.get(city)
+        if index is None:
+            with self._faiss_lock:
+                index = self._faiss_cache.get(city)
+                if index is None:
+                    path = self._index_path(city)
+                    if path is None:
+                        raise FileNotFoundError(f"FAISS not found: {self._data_dir / city / 'index.faiss'}")
+                    index = self._faiss_cache[city] = self._tune_index(self._read_index(path))
+        return index
+
+    @staticmethod
+    def _read_index(path: Path) -> faiss.Index:
+        """Đọc index bằng mmap; loại index không hỗ trợ mmap thì đọc thường."""
+        try:
+            return faiss.read_index(str(path), FAISS_IO_FLAGS)
+        except RuntimeError:
+            return faiss.read_index(str(path))
+
+    def _prefetch_index(self, city: str) -> None:
+        """Gợi ý OS đọc trước file index (WILLNEED) để query đầu không chờ page fault."""
+        path = self._index_path(city)
+        if path is None or not hasattr(os, "posix_fadvise"):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+    def _index_path(self, city: str) -> Optional[Path]:
+        for name in INDEX_FILES:
+            path = self._data_dir / city / name
+            if path.exists():
+                return path
+        return None
+
+    @staticmethod
+    def _tune_index(index: faiss.Index) -> faiss.Index:
+        """Set tham số search: efSearch cho HNSW, nprobe cho IVF."""
+        hnsw = getattr(index, "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = HNSW_EF_SEARCH
+        if hasattr(index, "nprobe"):
+            index.nprobe = IVF_NPROBE
+        return index
+
+    def _get_model(self) -> SentenceTransformer | OnnxEmbedder:
         if self._model is None:
-            logger.info("Loading embedding model…")
-            self._model = SentenceTransformer(self._model_name)
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
         return self._model
 
+    def _load_model(self) -> SentenceTransformer | OnnxEmbedder:
+        if self._onnx_dir is not None:
+            try:
+                logger.info(f"Loading ONNX embedding model from {self._onnx_dir}…")
+                return OnnxEmbedder(self._onnx_dir)
+            except Exception as e:
+                logger.warning(f"ONNX embedder unavailable ({e}), fallback SentenceTransformer")
+        logger.info("Loading embedding model…")
+        if EMBED_TORCH_THREADS > 0:
+            import torch
+            torch.set_num_threads(EMBED_TORCH_THREADS)
+        return SentenceTransformer(self._model_name)
+
     # ── Private: ORM helpers ───────────────────────────────────────────────────
 
+    def _ensure_indexes(self, city: str) -> None:
+        """Tạo index phụ khai báo trên Food + bảng FTS5 (nếu pack cũ chưa có)."""
+        with db_session(city, self._data_dir) as session:
+            conn = session.connection()
+            for index in Food.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+            if ensure_fts(conn):
+                self._fts_cities.add(city)
+
     def _fetch_by_ids(self, city: str, ids: list[int]) -> list[FoodItem]:
         """Lấy foods theo list id, giữ đúng thứ tự relevance từ FAISS."""
         if not ids:
             return []
         with db_session(city, self._data_dir) as session:
-            rows = session.query(Food).filter(Food.id.in_(ids)).all()
-        row_map = {r.id: self._orm_to_item(r) for r in rows}
-        return [row_map[i] for i in ids if i in row_map]
+            rows = session.execute(select(*ITEM_COLUMNS).where(Food.id.in_(ids))).all()
+        if not rows:
+            return []
+        row_ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=len(rows))
+        target  = np.asarray(ids, dtype=np.int64)
+        sorter  = np.argsort(row_ids)
+        idx     = np.minimum(np.searchsorted(row_ids, target, sorter=sorter), len(rows) - 1)
+        pos     = sorter[idx]
+        pos     = pos[row_ids[pos] == target]   # bỏ id không có trong DB
+        return [self._orm_to_item(rows[p]) for p in pos]
+
+    def _fetch_fts(self, city: str, keyword: str, limit: int) -> list[FoodItem]:
+        with db_session(city, self._data_dir) as session:
+            rows = session.execute(
+                RANK_SQL, {"q": match_query(keyword.strip()), "lim": limit}
+            ).all()
+        return [self._orm_to_item(r) for r in rows]
+
+    def _fetch_fts_multi(self, city: str, keywords: list[str], per_limit: int) -> list[list[FoodItem]]:
+        buckets: list[list[FoodItem]] = [[] for _ in keywords]
+        valid = [i for i, kw in enumerate(keywords) if len(kw.strip()) >= FTS_MIN_CHARS]
+        if not valid:
+            return buckets
+        params = {f"q{j}": match_query(keywords[i].strip()) for j, i in enumerate(valid)}
+        params["lim"] = per_limit
+        with db_session(city, self._data_dir) as session:
+            rows = session.execute(union_rank_sql(len(valid)), params).all()
+        for row in rows:
+            buckets[valid[row.bucket]].append(self._orm_to_item(row))
+        return buckets
 
     def _fetch_by_name(self, city: str, keyword: str, limit: int) -> list[FoodItem]:
-        """LIKE search trên ten_quan + ten_mon, ưu tiên click cao."""
+        """Tìm trên ten_quan + ten_mon, ưu tiên click cao.
+        Dùng FTS5 trigram nếu có; keyword < 3 ký tự hoặc chưa có FTS → LIKE.
+        """
+        if city in self._fts_cities and len(keyword.strip()) >= FTS_MIN_CHARS:
+            with db_session(city, self._data_dir) as session:
+                rows = session.execute(
+                    SEARCH_SQL, {"q": match_query(keyword.strip()), "lim": limit}
+                ).all()
+            return [self._orm_to_item(r) for r in rows]
         like = f"%{keyword}%"
         with db_session(city, self._data_dir) as session:
-            rows = (
-                session.query(Food)
-                .filter(Food.ten_quan.ilike(like) | Food.ten_mon.ilike(like))
+            rows = session.execute(
+                select(*ITEM_COLUMNS)
+                .where(Food.ten_quan.ilike(like) | Food.ten_mon.ilike(like))
                 .order_by(Food.so_lan_click.desc())
                 .limit(limit)
-                .all()
-            )
+            ).all()
         return [self._orm_to_item(r) for r in rows]
 
     # ── Private: City Insights ORM ─────────────────────────────────────────────
 
     def _fetch_top_clicks(self, city: str, limit: int) -> list[dict]:
+        return self._fetch_ranked(city, limit, clicked_only=False)
+
+    def _fetch_ranked(self, city: str, limit: int, clicked_only: bool) -> list[dict]:
+        """Top `limit` theo so_lan_click; rank tính trong SQL bằng ROW_NUMBER()."""
+        clicks = func.coalesce(Food.so_lan_click, 0)
+        rank   = func.row_number().over(order_by=clicks.desc()).label("rank")
+        stmt   = select(*ITEM_COLUMNS, clicks.label("so_lan_click"), rank)
+        if clicked_only:
+            stmt = stmt.where(Food.so_lan_click > 0)
+        stmt = stmt.order_by(rank).limit(limit)
         with db_session(city, self._data_dir) as session:
-            rows = (
-                session.query(Food)
-                .order_by(Food.so_lan_click.desc())
-                .limit(limit)
-                .all()
-            )
+            rows = session.execute(stmt).all()
         return [
-            {**self._orm_to_item(r).model_dump(), "so_lan_click": r.so_lan_click or 0, "rank": rank}
-            for rank, r in enumerate(rows, start=1)
+            {**self._orm_to_item(r).model_dump(), "so_lan_click": r.so_lan_click, "rank": r.rank}
+            for r in rows
         ]
 
+    def _precompute_aggregates(self, city: str) -> None:
+        """Tính sẵn các STATIC_AGGREGATES của city vào `_aggregates` (gọi lúc preload)."""
+        fetchers = {
+            "district_stats":     self._fetch_district_stats,
+            "price_distribution": self._fetch_price_dist,
+            "category_stats":     self._fetch_category_stats,
+        }
+        for name in STATIC_AGGREGATES:
+            self._aggregates[(name, city)] = fetchers[name](city)
+
     def _fetch_district_stats(self, city: str) -> list[dict]:
         with db_session(city, self._data_dir) as session:
             rows = (
@@ -242,64 +507,82 @@ class SearchService:
         }
 
     def _fetch_category_stats(self, city: str) -> list[dict]:
-        """Phân loại theo khoảng giá (DB không có cột loai_hinh)."""
-        with db_session(city, self._data_dir) as session:
-            total = session.query(func.count(Food.id)).scalar() or 1
-
-            buckets = [
-                ("Bình dân (< 50k)",       Food.gia_min < 50_000),
-                ("Tầm trung (50k–150k)",   (Food.gia_min >= 50_000) & (Food.gia_min <= 150_000)),
-                ("Cao cấp (> 150k)",       Food.gia_min > 150_000),
-                ("Chưa có giá",            Food.gia_min == 0),
-            ]
-            result = []
-            for label, condition in buckets:
-                count = session.query(func.count(Food.id)).filter(condition).scalar() or 0
-                result.append({
-                    "loai_hinh":  label,
-                    "total":      count,
-                    "percentage": round(count / total * 100, 1),
-                })
-        return result
-
-    def _fetch_trending(self, city: str, limit: int) -> list[dict]:
+        """Phân loại theo khoảng giá (DB không có cột loai_hinh) – 1 query aggregate."""
         with db_session(city, self._data_dir) as session:
-            rows = (
-                session.query(Food)
-                .filter(Food.so_lan_click > 0)
-                .order_by(Food.so_lan_click.desc())
-                .limit(limit)
-                .all()
-            )
+            row = session.query(
+                func.count().label("total"),
+                func.sum(case((Food.gia_min < 50_000, 1), else_=0)).label("binh_dan"),
+                func.sum(case(((Food.gia_min >= 50_000) & (Food.gia_min <= 150_000), 1), else_=0)).label("tam_trung"),
+                func.sum(case((Food.gia_min > 150_000, 1), else_=0)).label("cao_cap"),
+                func.sum(case((Food.gia_min == 0, 1), else_=0)).label("chua_gia"),
+            ).one()
+        total   = row.total or 1
+        buckets = [
+            ("Bình dân (< 50k)",     row.binh_dan),
+            ("Tầm trung (50k–150k)", row.tam_trung),
+            ("Cao cấp (> 150k)",     row.cao_cap),
+            ("Chưa có giá",          row.chua_gia),
+        ]
         return [
-            {**self._orm_to_item(r).model_dump(), "so_lan_click": r.so_lan_click or 0, "rank": rank}
-            for rank, r in enumerate(rows, start=1)
+            {
+                "loai_hinh":  label,
+                "total":      count or 0,
+                "percentage": round((count or 0) / total * 100, 1),
+            }
+            for label, count in buckets
         ]
 
+    def _fetch_trending(self, city: str, limit: int) -> list[dict]:
+        return self._fetch_ranked(city, limit, clicked_only=True)
+
     def _fetch_random(
         self, city: str,
         district: str | None,
         max_price: int | None,
         limit: int,
     ) -> list[FoodItem]:
+        """Lọc + lấy mẫu trên danh sách id cache trong RAM (mask numpy), rồi chỉ
+        fetch `limit` dòng theo PK – không ORDER BY RANDOM() quét + sort cả bảng."""
+        ids, places, gia_min, gia_max = self._random_pool(city)
+        mask = np.ones(len(ids), dtype=bool)
+        if district:
+            mask &= np.char.find(places, district.casefold()) >= 0
+        if max_price:
+            mask &= (gia_min <= max_price) | ((gia_min == 0) & (gia_max <= max_price))
+        candidates = ids[mask]
+        if not len(candidates):
+            return []
+        picked = np.random.default_rng().choice(candidates, size=min(limit, len(candidates)), replace=False)
+        return self._fetch_by_ids(city, picked.tolist())   # giữ thứ tự ngẫu nhiên của picked
+
+    def _random_pool(self, city: str) -> tuple[np.ndarray, ...]:
+        """(ids, "quận địa chỉ" casefold, gia_min, gia_max) dạng mảng song song, cache RANDOM_POOL_TTL giây."""
+        hit = self._random_pools.get(city)
+        if hit is not None and time.monotonic() - hit[0] < RANDOM_POOL_TTL:
+            return hit[1]
+        stmt = select(
+            Food.id, Food.quan, Food.dia_chi,
+            func.coalesce(Food.gia_min, 0), func.coalesce(Food.gia_max, 0),
+        )
         with db_session(city, self._data_dir) as session:
-            q = session.query(Food)
-            if district:
-                like = f"%{district}%"
-                q = q.filter(Food.quan.ilike(like) | Food.dia_chi.ilike(like))
-            if max_price:
-                q = q.filter(
-                    (Food.gia_min <= max_price) |
-                    ((Food.gia_min == 0) & (Food.gia_max <= max_price))
-                )
-            rows = q.order_by(func.random()).limit(limit).all()
-        return [self._orm_to_item(r) for r in rows]
+            rows = session.execute(stmt).all()
+        pool = (
+            np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            np.array([f"{r[1] or ''}\n{r[2] or ''}".casefold() for r in rows], dtype=str),
+            np.fromiter((r[3] for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r[4] for r in rows), dtype=np.int64, count=len(rows)),
+        )
+        self._random_pools[city] = (time.monotonic(), pool)
+        return pool
 
     # ── Private: Converters ────────────────────────────────────────────────────
 
     @staticmethod
-    def _orm_to_item(food: Food) -> FoodItem:
-        return FoodItem(
+    def _orm_to_item(food: Food | Row) -> FoodItem:
+        """Food ORM object hoặc Row (select ITEM_COLUMNS) → FoodItem.
+        model_construct: bỏ validation pydantic – dữ liệu lấy từ DB của mình.
+        """
+        return FoodItem.model_construct(
             id=food.id,
             ten_quan=food.ten_quan or "",
             ten_mon=food.ten_mon   or "",
@@ -313,13 +596,14 @@ class SearchService:
 
     @staticmethod
     def _merge(priority: list[FoodItem], secondary: list[FoodItem], top_k: int) -> list[FoodItem]:
-        seen: set[int] = set()
-        merged: list[FoodItem] = []
-        for item in [*priority, *secondary]:
-            if item.id not in seen:
-                seen.add(item.id)
-                merged.append(item)
-        return merged[:top_k]
+        """Dedup theo id giữ thứ tự (dict insertion-ordered), dừng ngay khi đủ top_k."""
+        merged: dict[int, FoodItem] = {}
+        for items in (priority, secondary):
+            for item in items:
+                if len(merged) >= top_k:
+                    return list(merged.values())
+                merged.setdefault(item.id, item)
+        return list(merged.values())
 
     @staticmethod
     def _validate_city(city: str) -> None:
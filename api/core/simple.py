@@ -3,92 +3,275 @@ core/simple.py – SimpleQueryHandler class.
 Trách nhiệm: xử lý simple queries bằng template (chi phí $0).
 """
 import re
+import math
 import asyncio
-from typing import Optional, Callable, Awaitable
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Callable, Awaitable, Union
+
+from cachetools import TTLCache
+
 from ..models import FoodItem
+from .router import QueryRouter
+
+try:                        # google-re2 (tùy chọn): DFA, thời gian tuyến tính
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
+
+try:                        # hyperscan (tùy chọn): quét SIMD nhiều pattern trong 1 lượt
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 SearchFn = Callable[[str, int], Awaitable[list[FoodItem]]]
+MultiSearchFn = Callable[[list[str], int], Awaitable[list[list[FoodItem]]]]
+
+RESULT_CACHE_SIZE = 2048
+RESULT_CACHE_TTL  = 300   # giây
+_PRICE_DIV        = 1000  # đ → k
+
+
+def _compile(pattern: str):
+    """Compile bằng RE2 nếu có, không thì stdlib re.
+    Không cần cờ IGNORECASE: parse_intent đã casefold query, pattern viết thường.
+    """
+    return _re_engine.compile(pattern)
+
+
+def _normalize(query: str) -> str:
+    """casefold + gộp mọi khoảng trắng Unicode (NBSP, \u2003, ...) thành 1 space ASCII.
+    `\s` của RE2 (và Hyperscan không UCP) chỉ khớp ASCII, của stdlib re khớp cả Unicode
+    → chuẩn hoá trước để mọi engine match giống nhau.
+    """
+    return " ".join(query.casefold().split())
+
+
+# ── Intent regexes (compile 1 lần khi import) ─────────────────────────────────
+
+_RE_COMPARE = _compile(r"so s[aá]nh\s+(.+?)\s+(?:v[aà]|v[oớ]i|vs)\s+(.+?)(?:\s|$)")
+_RE_PRICE   = _compile(r"(.+?)\s+(?:gi[aá] bao nhi[eê]u|bao nhi[eê]u ti[eề]n|gi[aá] th[eế] n[aà]o)")
+_RE_WANT    = _compile(
+    r"(?:t[oô]i (?:mu[oố]n|th[iíì]ch|c[aầ]n) [aă]n"
+    r"|cho t[oô]i [aă]n"
+    r"|toi (?:muon|thich|can) an"
+    r"|cho toi an)\s+(.+?)(?:\s*$|\.)"
+)
+_RE_SUGGEST_TRIGGER = _compile(r"g[oợ]i [yý]|goi y|suggest|recommend")
+_RE_SUGGEST_EXTRACT = _compile(r"(?:g[oợ]i [yý]|goi y|suggest)\s+(?:m[oó]n\s+)?(.+?)(?:\s|$)")
+
+# Gộp 4 intent thành 1 pattern, match từ vị trí 0: prefix lazy [\s\S]*? cho mỗi
+# nhánh tương đương search(), và nhánh trước thử hết chuỗi trước nhánh sau
+# → giữ đúng thứ tự ưu tiên compare > price > want > suggest.
+_RE_INTENT = _compile(
+    r"(?P<compare>[\s\S]*?so s[aá]nh\s+(?P<c1>.+?)\s+(?:v[aà]|v[oớ]i|vs)\s+(?P<c2>.+?)(?:\s|$))"
+    r"|(?P<price>[\s\S]*?(?P<p1>.+?)\s+(?:gi[aá] bao nhi[eê]u|bao nhi[eê]u ti[eề]n|gi[aá] th[eế] n[aà]o))"
+    r"|(?P<want>[\s\S]*?(?:t[oô]i (?:mu[oố]n|th[iíì]ch|c[aầ]n) [aă]n"
+    r"|cho t[oô]i [aă]n"
+    r"|toi (?:muon|thich|can) an"
+    r"|cho toi an)\s+(?P<w1>.+?)(?:\s*$|\.))"
+    r"|(?P<suggest>[\s\S]*?(?:g[oợ]i [yý]|goi y|suggest|recommend))"
+)
+
+# Thứ tự = id = độ ưu tiên: compare > price > want > suggest
+_TRIGGERS = (_RE_COMPARE, _RE_PRICE, _RE_WANT, _RE_SUGGEST_TRIGGER)
+
+
+def _build_hs_db():
+    """Compile 4 intent pattern thành 1 Hyperscan database.
+    Trả về (db, scratch) hoặc None nếu không có hyperscan / pattern không compile được.
+    """
+    if hyperscan is None:
+        return None
+    # Không HS_FLAG_UCP: \s/\w chỉ ASCII, giống RE2 dùng để trích group ở _parse_intent_hs
+    flags = hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_SINGLEMATCH
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[r.pattern.encode() for r in _TRIGGERS],
+            ids=list(range(len(_TRIGGERS))),
+            elements=len(_TRIGGERS),
+            flags=[flags] * len(_TRIGGERS),
+        )
+        return db, hyperscan.Scratch(db)
+    except Exception:
+        return None
+
+
+# Scratch không thread-safe – chỉ parse trên event loop (1 thread)
+_HS = _build_hs_db()
+
+
+def _hs_intent_id(q: str) -> Optional[int]:
+    """1 lượt quét Hyperscan → id intent ưu tiên cao nhất khớp, None nếu không khớp."""
+    db, scratch = _HS
+    hits: list[int] = []
+    db.scan(q.encode(), match_event_handler=lambda id_, *_: hits.append(id_), scratch=scratch)
+    return min(hits) if hits else None
+
+
+def _parse_intent_hs(q: str) -> tuple[str, str, Optional[str]]:
+    """Hyperscan chỉ báo pattern nào khớp; group được trích bằng regex của đúng pattern đó."""
+    idx = _hs_intent_id(q)
+    if idx is None:
+        return ("unknown", q[:40], None)
+    if idx == 3:
+        e = _RE_SUGGEST_EXTRACT.search(q)
+        return ("suggest", e.group(1).strip() if e else "", None)
+    m = _TRIGGERS[idx].search(q)
+    if m is None:                # 2 engine lệch nhau → không tin hit, dùng đường regex
+        return _parse_intent_re(q)
+    if idx == 0:
+        return ("price_compare", m.group(1).strip(), m.group(2).strip())
+    return ("price_query" if idx == 1 else "want_to_eat", m.group(1).strip(), None)
+
+
+def _parse_intent_re(q: str) -> tuple[str, str, Optional[str]]:
+    """1 regex gộp – ưu tiên compare > price > want > suggest như _TRIGGERS."""
+    m = _RE_INTENT.match(q)
+    if m is None:
+        return ("unknown", q[:40], None)
+    kind = m.lastgroup
+    if kind == "compare":
+        return ("price_compare", m.group("c1").strip(), m.group("c2").strip())
+    if kind == "price":
+        return ("price_query", m.group("p1").strip(), None)
+    if kind == "want":
+        return ("want_to_eat", m.group("w1").strip(), None)
+    e = _RE_SUGGEST_EXTRACT.search(q)
+    return ("suggest", e.group(1).strip() if e else "", None)
+
+
+@lru_cache(maxsize=1024)
+def _parse_intent_cached(q: str) -> tuple[str, str, Optional[str]]:
+    """Pure helper – query lặp lại nhiều (kể cả unknown) → cache kết quả."""
+    if _HS is not None:
+        return _parse_intent_hs(q)
+    return _parse_intent_re(q)
 
 
 class SimpleQueryHandler:
     """Template-based handler cho simple queries – không gọi Gemini."""
 
+    def __init__(self) -> None:
+        # (query, city, bữa) → (reply, items, was_handled); cache cả kết quả was_handled=False
+        self._results: TTLCache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+        self._locks: dict[tuple, asyncio.Lock] = {}
+
     # ── Public API ─────────────────────────────────────────────────────────────
 
+    async def handle_cached(
+        self,
+        query: str,
+        city: str,
+        search_fn: SearchFn,
+        hour: int,
+        fts_fn: Optional[SearchFn] = None,
+        multi_fn: Optional[MultiSearchFn] = None,
+    ) -> tuple[str, list[FoodItem], bool]:
+        """Như handle() nhưng cache theo (query chuẩn hoá, city, bữa ăn).
+        Query trùng nhau đang chạy đồng thời chỉ gọi search 1 lần.
+        """
+        key = (_normalize(query), city, QueryRouter.get_meal_time(hour))
+        hit = self._results.get(key)
+        if hit is not None:
+            return hit
+        try:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                hit = self._results.get(key)
+                if hit is None:
+                    hit = await self.handle(query, search_fn, hour, fts_fn, multi_fn)
+                    self._results[key] = hit
+        finally:
+            self._locks.pop(key, None)   # cả khi handle() lỗi → _locks không phình theo query lỗi
+        return hit
+
+    async def handle_stream(
+        self,
+        query: str,
+        city: str,
+        search_fn: SearchFn,
+        hour: int,
+        fts_fn: Optional[SearchFn] = None,
+        multi_fn: Optional[MultiSearchFn] = None,
+    ) -> AsyncIterator[Union[str, tuple[list[FoodItem], bool]]]:
+        """Như handle_cached nhưng yield reply theo từng đoạn (header, từng quán…)
+        để gửi dần qua WebSocket. Phần tử cuối luôn là sentinel (items, was_handled).
+        """
+        text, items, handled = await self.handle_cached(query, city, search_fn, hour, fts_fn, multi_fn)
+        if handled:
+            blocks = text.split("\n\n")
+            for block in blocks[:-1]:
+                yield block + "\n\n"
+            yield blocks[-1]
+        yield (items, handled)
+
     async def handle(
         self,
         query: str,
         search_fn: SearchFn,
         hour: int,
+        fts_fn: Optional[SearchFn] = None,
+        multi_fn: Optional[MultiSearchFn] = None,
     ) -> tuple[str, list[FoodItem], bool]:
         """
         Xử lý query. Trả về (reply, items, was_handled).
         was_handled=False → caller cần fallback lên Gemini.
+        fts_fn (tùy chọn): search keyword thuần SQL, ưu tiên cho keyword 1 từ.
+        multi_fn (tùy chọn): search nhiều keyword trong 1 query (so sánh giá).
         """
         intent, kw, kw2 = self.parse_intent(query)
         if intent == "want_to_eat":
-            return await self._handle_want(kw, search_fn)
+            return await self._handle_want(kw, search_fn, fts_fn)
         if intent == "price_query":
-            return await self._handle_price(kw, search_fn)
+            return await self._handle_price(kw, search_fn, fts_fn)
         if intent == "price_compare":
-            return await self._handle_compare(kw, kw2 or "", search_fn)
+            return await self._handle_compare(kw, kw2 or "", search_fn, multi_fn)
         if intent == "suggest":
             return await self._handle_suggest(kw, search_fn, hour)
         return "", [], False
 
     def parse_intent(self, query: str) -> tuple[str, str, Optional[str]]:
-        """Trích xuất (intent, keyword, second_keyword) từ query."""
-        q = query.lower().strip()
-        return (
-            self._try_compare(q)
-            or self._try_price(q)
-            or self._try_want(q)
-            or self._try_suggest(q)
-            or ("unknown", q[:40], None)
-        )
+        """Trích xuất (intent, keyword, second_keyword) từ query (cache theo query đã chuẩn hoá)."""
+        return _parse_intent_cached(_normalize(query))
 
-    # ── Intent parsers ─────────────────────────────────────────────────────────
-
-    def _try_compare(self, q: str) -> Optional[tuple]:
-        m = re.search(r"so s[aá]nh\s+(.+?)\s+(?:v[aà]|v[oớ]i|vs)\s+(.+?)(?:\s|$)", q, re.I)
-        return ("price_compare", m.group(1).strip(), m.group(2).strip()) if m else None
-
-    def _try_price(self, q: str) -> Optional[tuple]:
-        m = re.search(r"(.+?)\s+(?:gi[aá] bao nhi[eê]u|bao nhi[eê]u ti[eề]n|gi[aá] th[eế] n[aà]o)", q, re.I)
-        return ("price_query", m.group(1).strip(), None) if m else None
-
-    def _try_want(self, q: str) -> Optional[tuple]:
-        m = re.search(
-            r"(?:t[oô]i (?:mu[oố]n|th[iíì]ch|c[aầ]n) [aă]n"
-            r"|cho t[oô]i [aă]n"
-            r"|toi (?:muon|thich|can) an"
-            r"|cho toi an)\s+(.+?)(?:\s*$|\.)",
-            q, re.I,
-        )
-        return ("want_to_eat", m.group(1).strip(), None) if m else None
-
-    def _try_suggest(self, q: str) -> Optional[tuple]:
-        if not re.search(r"g[oợ]i [yý]|goi y|suggest|recommend", q, re.I):
-            return None
-        m = re.search(r"(?:g[oợ]i [yý]|goi y|suggest)\s+(?:m[oó]n\s+)?(.+?)(?:\s|$)", q, re.I)
-        return ("suggest", m.group(1).strip() if m else "", None)
+    @staticmethod
+    def clear_cache() -> None:
+        _parse_intent_cached.cache_clear()
 
     # ── Response handlers ──────────────────────────────────────────────────────
 
-    async def _handle_want(self, kw: str, fn: SearchFn) -> tuple:
-        items = await fn(kw, 10)
+    async def _handle_want(self, kw: str, fn: SearchFn, fts_fn: Optional[SearchFn] = None) -> tuple:
+        items = await self._search_kw(kw, 10, fn, fts_fn)
         return self._resp_want(kw, items), items, True
 
-    async def _handle_price(self, kw: str, fn: SearchFn) -> tuple:
-        items = await fn(kw, 8)
+    async def _handle_price(self, kw: str, fn: SearchFn, fts_fn: Optional[SearchFn] = None) -> tuple:
+        items = await self._search_kw(kw, 8, fn, fts_fn)
         return self._resp_price(kw, items), items, True
 
-    async def _handle_compare(self, kw1: str, kw2: str, fn: SearchFn) -> tuple:
-        items1, items2 = await asyncio.gather(fn(kw1, 5), fn(kw2, 5))
+    @staticmethod
+    async def _or_search(items: list[FoodItem], kw: str, fn: SearchFn) -> list[FoodItem]:
+        return items or await fn(kw, 5)
+
+    @staticmethod
+    async def _search_kw(kw: str, limit: int, fn: SearchFn, fts_fn: Optional[SearchFn]) -> list[FoodItem]:
+        """Keyword 1 từ → thử FTS trước (không cần embed); không có kết quả → search_fn."""
+        if fts_fn is not None and kw and " " not in kw:
+            items = await fts_fn(kw, limit)
+            if items:
+                return items
+        return await fn(kw, limit)
+
+    async def _handle_compare(
+        self, kw1: str, kw2: str, fn: SearchFn, multi_fn: Optional[MultiSearchFn] = None,
+    ) -> tuple:
+        items1, items2 = await multi_fn([kw1, kw2], 5) if multi_fn is not None else ([], [])
+        if not items1 or not items2:   # keyword nào multi_fn không ra kết quả → search thường
+            items1, items2 = await asyncio.gather(
+                self._or_search(items1, kw1, fn), self._or_search(items2, kw2, fn)
+            )
         return self._resp_compare(kw1, items1, kw2, items2), [*items1, *items2], True
 
     async def _handle_suggest(self, kw: str, fn: SearchFn, hour: int) -> tuple:
-        from .router import QueryRouter
         meal = QueryRouter.get_meal_time(hour)
         items = await fn(kw or meal, 8)
         return self._resp_suggest(kw, items, meal), items, True
@@ -98,42 +281,57 @@ class SimpleQueryHandler:
     def _resp_want(self, kw: str, items: list[FoodItem]) -> str:
         if not items:
             return f"Chưa tìm thấy quán **{kw}** nào. Thử từ khoá khác nhé! 🙏"
-        lines = [
-            f"{i+1}. **{r.ten_quan}** ({r.ten_mon})\n"
+        parts = [f"Tìm được **{len(items)} quán {kw}** 🍽️"]
+        parts.extend(
+            f"\n\n{i+1}. **{r.ten_quan}** ({r.ten_mon})\n"
             f"   📍 {r.dia_chi}, {r.quan}\n"
             f"   💰 {self._fmt(r.gia_min, r.gia_max)}"
             for i, r in enumerate(items[:5])
-        ]
-        return f"Tìm được **{len(items)} quán {kw}** 🍽️\n\n" + "\n\n".join(lines)
+        )
+        return "".join(parts)
 
     def _resp_price(self, kw: str, items: list[FoodItem]) -> str:
         priced = [r for r in items if r.gia_min > 1 or r.gia_max > 1][:5]
         if not priced:
             return f"Chưa có thông tin giá của **{kw}**."
-        lines = [f"• **{r.ten_quan}**: {self._fmt(r.gia_min, r.gia_max)} đ" for r in priced]
-        lo = min(r.gia_min for r in priced if r.gia_min > 1)
-        hi = max(r.gia_max for r in priced if r.gia_max > 1)
-        return f"💰 **Giá {kw}:**\n\n" + "\n".join(lines) + f"\n\n*Dao động: {self._fmt(lo, hi)} đ*"
+        parts, lo, hi = [f"💰 **Giá {kw}:**\n"], math.inf, 0
+        for r in priced:   # 1 vòng: dòng giá + min/max
+            parts.append(f"\n• **{r.ten_quan}**: {self._fmt(r.gia_min, r.gia_max)} đ")
+            if 1 < r.gia_min < lo:
+                lo = r.gia_min
+            if 1 < r.gia_max and r.gia_max > hi:   # gia_max=1 là sentinel "không có giá"
+                hi = r.gia_max
+        lo = hi if lo is math.inf else lo   # chỉ có gia_max
+        parts.append(f"\n\n*Dao động: {self._fmt(lo, hi or lo)} đ*")
+        return "".join(parts)
 
     def _resp_compare(self, k1: str, i1: list, k2: str, i2: list) -> str:
-        def avg(lst): return sum((r.gia_min+r.gia_max)/2 for r in lst if r.gia_min>1 or r.gia_max>1) / max(len(lst),1)
-        cmp = ""
-        if i1 and i2:
-            a1, a2 = avg(i1), avg(i2)
-            winner = k1 if a1 < a2 else k2
-            cmp = f"\n\n👉 **{winner}** thường rẻ hơn"
+        def avg(lst):
+            total = 0.0
+            for r in lst:
+                if r.gia_min > 1 or r.gia_max > 1:
+                    total += (r.gia_min + r.gia_max) / 2
+            return total / max(len(lst), 1)
         def blk(k, lst): return f"**{k}**: {self._fmt(lst[0].gia_min,lst[0].gia_max)} đ" if lst else f"**{k}**: N/A"
-        return f"💰 So sánh giá:\n\n{blk(k1,i1)}\n{blk(k2,i2)}{cmp}"
+        parts = ["💰 So sánh giá:\n\n", blk(k1, i1), "\n", blk(k2, i2)]
+        if i1 and i2:
+            winner = k1 if avg(i1) < avg(i2) else k2
+            parts.append(f"\n\n👉 **{winner}** thường rẻ hơn")
+        return "".join(parts)
 
     def _resp_suggest(self, kw: str, items: list[FoodItem], meal: str) -> str:
         if not items:
             return "Không tìm được gợi ý phù hợp."
-        lines = [f"{i+1}. **{r.ten_mon}** – {r.ten_quan} – {self._fmt(r.gia_min,r.gia_max)} đ" for i,r in enumerate(items[:3])]
         label = f" {kw}" if kw else ""
-        return f"🍽️ Gợi ý{label} {meal}:\n\n" + "\n".join(lines)
+        parts = [f"🍽️ Gợi ý{label} {meal}:\n"]
+        parts.extend(f"\n{i+1}. **{r.ten_mon}** – {r.ten_quan} – {self._fmt(r.gia_min,r.gia_max)} đ" for i,r in enumerate(items[:3]))
+        return "".join(parts)
 
     @staticmethod
-    def _fmt(mn: int, mx: int) -> str:
+    def _fmt(mn: int, mx: int, _d: int = _PRICE_DIV) -> str:
+        # _d bind vào local qua default arg → tránh lookup global mỗi lần gọi
         if mn <= 1 and mx <= 1: return "Chưa có giá"
-        if mn == mx: return f"{mx//1000}k"
-        return f"{mn//1000}k–{mx//1000}k"
+        if mx <= 1: return f"{mn // _d}k"   # chỉ có gia_min (gia_max=1 là sentinel)
+        mxk = mx // _d
+        if mn == mx or mn <= 1: return f"{mxk}k"
+        return f"{mn // _d}k–{mxk}k"
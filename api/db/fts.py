@@ -0,0 +1,92 @@
+"""
+api/db/fts.py – FTS5 index cho tìm kiếm tên quán / tên món.
+
+Bảng ảo `food_fts` (external content = `food`, tokenizer trigram) cho phép
+MATCH substring không phân biệt hoa thường thay vì quét LIKE '%kw%'.
+Trigger giữ FTS đồng bộ khi food thay đổi (update so_lan_click không kích hoạt).
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+FTS_TABLE     = "food_fts"
+FTS_MIN_CHARS = 3   # trigram cần keyword ≥ 3 ký tự
+# Chỉ lấy cột cần cho FoodItem (không so_lan_click/ORM object) – bản SQL thô của core.search.ITEM_COLUMNS
+ITEM_COLUMNS_SQL = "food.id, food.ten_quan, food.ten_mon, food.dia_chi, food.quan, food.thanh_pho, food.gia_min, food.gia_max, food.note"
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        ten_quan, ten_mon, content='food', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER food_fts_ai AFTER INSERT ON food BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, ten_quan, ten_mon) VALUES (new.id, new.ten_quan, new.ten_mon);
+    END""",
+    f"""CREATE TRIGGER food_fts_ad AFTER DELETE ON food BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, ten_quan, ten_mon)
+        VALUES ('delete', old.id, old.ten_quan, old.ten_mon);
+    END""",
+    f"""CREATE TRIGGER food_fts_au AFTER UPDATE OF ten_quan, ten_mon ON food BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, ten_quan, ten_mon)
+        VALUES ('delete', old.id, old.ten_quan, old.ten_mon);
+        INSERT INTO {FTS_TABLE}(rowid, ten_quan, ten_mon) VALUES (new.id, new.ten_quan, new.ten_mon);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SEARCH_SQL = text(f"""
+    SELECT {ITEM_COLUMNS_SQL} FROM food
+    JOIN {FTS_TABLE} ON food.id = {FTS_TABLE}.rowid
+    WHERE {FTS_TABLE} MATCH :q
+    ORDER BY food.so_lan_click DESC
+    LIMIT :lim
+""")
+
+# Xếp theo độ liên quan bm25 (rank) thay vì click – dùng cho fts_search
+RANK_SQL = text(f"""
+    SELECT {ITEM_COLUMNS_SQL} FROM food
+    JOIN {FTS_TABLE} ON food.id = {FTS_TABLE}.rowid
+    WHERE {FTS_TABLE} MATCH :q
+    ORDER BY {FTS_TABLE}.rank
+    LIMIT :lim
+""")
+
+
+def union_rank_sql(n: int):
+    """UNION ALL n nhánh MATCH (tham số :q{i}, :lim), mỗi dòng gắn cột `bucket` = i."""
+    branches = [
+        f"""SELECT * FROM (
+            SELECT {i} AS bucket, {ITEM_COLUMNS_SQL} FROM food
+            JOIN {FTS_TABLE} ON food.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :q{i}
+            ORDER BY {FTS_TABLE}.rank
+            LIMIT :lim
+        )"""
+        for i in range(n)
+    ]
+    return text("\nUNION ALL\n".join(branches))
+
+
+def has_fts(conn: Connection) -> bool:
+    row = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+    ).first()
+    return row is not None
+
+
+def ensure_fts(conn: Connection) -> bool:
+    """Tạo + build `food_fts` nếu chưa có. Trả về False nếu SQLite không hỗ trợ FTS5/trigram.
+    DDL chạy trong SAVEPOINT: lỗi giữa chừng → rollback, không để lại bảng/trigger dở dang.
+    """
+    if has_fts(conn):
+        return True
+    try:
+        with conn.begin_nested():
+            for stmt in _DDL:
+                conn.execute(text(stmt))
+    except Exception:
+        return False
+    return True
+
+
+def match_query(keyword: str) -> str:
+    """Bọc keyword thành 1 phrase FTS5 – tránh cú pháp MATCH (AND/OR/*, ...) trong input."""
+    return '"' + keyword.replace('"', '""') + '"'
@@ -2,9 +2,9 @@
 api/db/models.py – SQLAlchemy ORM model cho bảng `food`.
 
 Không tạo bảng (schema do build_pack_online.py tạo sẵn).
-Chỉ map Python class ↔ SQLite table.
+Chỉ map Python class ↔ SQLite table; index phụ được tạo bổ sung lúc preload.
 """
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -14,6 +14,9 @@ class Base(DeclarativeBase):
 
 class Food(Base):
     __tablename__ = "food"
+    __table_args__ = (
+        Index("idx_food_gia_min", "gia_min"),   # thống kê theo khoảng giá
+    )
 
     id           = Column(Integer, primary_key=True, autoincrement=True)
     ten_quan     = Column(String,  nullable=True, default="")
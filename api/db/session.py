@@ -1,46 +1,87 @@
 """
 api/db/session.py – Engine factory + Session helper.
 
-Mỗi city có 1 sqlite file riêng → cache 1 Engine per city.
+Mỗi city có 1 sqlite file riêng → cache 1 Engine per (city, data_dir).
 Dùng scoped session (contextmanager) để auto-close sau mỗi operation.
 """
+import logging
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Generator
 
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
+logger = logging.getLogger(__name__)
 
-# ── Engine cache (1 engine / city) ────────────────────────────────────────────
 
-_engines: dict[str, Engine] = {}
-_session_factories: dict[str, sessionmaker] = {}
+# ── Engine cache (1 engine / city + data_dir) ─────────────────────────────────
+
+EngineKey = tuple[str, str]   # (city, str(data_dir))
+
+_engines: dict[EngineKey, Engine] = {}
+_session_factories: dict[EngineKey, sessionmaker] = {}
+
+
+def engine_key(city: str, data_dir: Path) -> EngineKey:
+    return city, str(data_dir)
+
+
+# PRAGMA áp dụng cho mọi connection mới (workload chủ yếu đọc)
+_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-64000;
+    PRAGMA temp_store=MEMORY;
+"""
+# Thread pool của SearchService: mọi truy vấn DB chạy trên db pool hoặc ml pool (_fetch_by_ids sau FAISS)
+DB_WORKERS   = 8
+ML_WORKERS   = 2
+# 1 connection / worker thread; overflow nhỏ cho preload/caller ngoài pool
+POOL_SIZE    = DB_WORKERS + ML_WORKERS
+MAX_OVERFLOW = 2
 
 
 def _get_engine(city: str, data_dir: Path) -> Engine:
-    if city not in _engines:
+    key = engine_key(city, data_dir)
+    if key not in _engines:
         db_path = data_dir / city / "food.db"
         engine = create_engine(
             f"sqlite:///{db_path}",
             connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_pre_ping=False,
             echo=False,
         )
-        # Bật WAL mode để tăng hiệu năng đọc concurrent trên SQLite
+        # WAL + mmap 256MB + page cache 64MB + temp table trong RAM
         @event.listens_for(engine, "connect")
-        def set_wal(conn, _):
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
+        def set_pragmas(conn, _):
+            conn.executescript(_PRAGMAS)
+
+        _engines[key] = engine
+        _session_factories[key] = sessionmaker(bind=engine, expire_on_commit=False)
+    return _engines[key]
+
 
-        _engines[city] = engine
-        _session_factories[city] = sessionmaker(bind=engine, expire_on_commit=False)
-    return _engines[city]
+def preload_engines(data_dir: Path, cities: list[str]) -> None:
+    """Tạo sẵn engine + connection cho từng city và đọc qua bảng food
+    → PRAGMA/WAL + page cache đã ấm trước request đầu tiên."""
+    for city in cities:
+        try:
+            with _get_engine(city, data_dir).connect() as conn:
+                conn.execute(text("SELECT count(*) FROM food")).scalar()
+        except Exception as e:
+            logger.warning(f"Could not preload engine {city}: {e}")
 
 
 def get_session_factory(city: str, data_dir: Path) -> sessionmaker:
     _get_engine(city, data_dir)
-    return _session_factories[city]
+    return _session_factories[engine_key(city, data_dir)]
 
 
 @contextmanager
@@ -16,7 +16,10 @@ from .handlers.nearby_handler import NearbyHandler
 # ── Core singletons ────────────────────────────────────────────────────────────
 
 _router  = QueryRouter()
-_search  = SearchService(data_dir=os.getenv("DATA_DIR", "./data"))
+_search  = SearchService(
+    data_dir=os.getenv("DATA_DIR", "./data"),
+    onnx_dir=os.getenv("EMBED_ONNX_DIR") or None,
+)
 _prompts = PromptBuilder()
 _gemini  = GeminiService(
     api_key=os.getenv("GEMINI_API_KEY", ""),
@@ -4,13 +4,13 @@ Hỗ trợ cả REST (JSON) và streaming (cho WebSocket).
 """
 import os
 import logging
+from functools import lru_cache
 from typing import AsyncIterator
-from datetime import datetime
 
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 
-from .router_model import ModelTier, build_system_prompt, get_meal_time
+from .router_model import ModelTier, build_system_prompt, current_hour, get_meal_time
 from .models import FoodItem
 
 logger = logging.getLogger(__name__)
@@ -57,14 +57,22 @@ def _food_context(items: list[FoodItem]) -> str:
     """Chuyển danh sách món ăn thành context text cho Gemini."""
     if not items:
         return ""
-    lines = []
-    for r in items[:10]:
-        price = ""
-        if r.gia_min > 1 or r.gia_max > 1:
-            price = f", giá {r.gia_min//1000}k–{r.gia_max//1000}k đ"
-        note = f", ghi chú: {r.note}" if r.note else ""
-        lines.append(f"- {r.ten_quan} ({r.ten_mon}) | {r.dia_chi}, {r.quan}{price}{note}")
-    return "Dữ liệu quán ăn tìm được:\n" + "\n".join(lines)
+    key = tuple(
+        (r.ten_quan, r.ten_mon, r.dia_chi, r.quan, r.gia_min, r.gia_max, r.note)
+        for r in items[:10]
+    )
+    return _food_context_cached(key)
+
+
+@lru_cache(maxsize=256)
+def _food_context_cached(rows: tuple[tuple, ...]) -> str:
+    """Cache theo nội dung 10 quán đầu – retry / reconnect WS gửi lại cùng items."""
+    return "Dữ liệu quán ăn tìm được:\n" + "\n".join(
+        f"- {ten_quan} ({ten_mon}) | {dia_chi}, {quan}"
+        f"{f', giá {gia_min//1000}k–{gia_max//1000}k đ' if gia_min > 1 or gia_max > 1 else ''}"
+        f"{f', ghi chú: {note}' if note else ''}"
+        for ten_quan, ten_mon, dia_chi, quan, gia_min, gia_max, note in rows
+    )
 
 
 # ── REST (single response) ────────────────────────────────────────────────────
@@ -81,7 +89,7 @@ async def chat_gemini(
     """Gọi Gemini và trả về full response string."""
     import asyncio
 
-    hour = datetime.now().hour
+    hour = current_hour()
     system = build_system_prompt(tier, city, hour, user_address)
 
     # Thêm food context vào system prompt nếu có
@@ -126,13 +134,13 @@ async def stream_gemini(
     """
     AsyncGenerator yield từng chunk text từ Gemini streaming API.
     Dùng cho WebSocket endpoint.
-    Dùng threading.Thread để không block event loop.
+    Worker thread đẩy chunk vào asyncio.Queue qua loop.call_soon_threadsafe
+    → event-driven, không poll.
     """
     import asyncio
     import threading
-    from queue import Queue, Empty
 
-    hour = datetime.now().hour
+    hour = current_hour()
     system = build_system_prompt(tier, city, hour, user_address)
     if food_context:
         system += "\n\n" + _food_context(food_context)
@@ -141,9 +149,13 @@ async def stream_gemini(
     model_name = _MODEL_MAP[tier]
     gen_config = GenerationConfig(max_output_tokens=min(max_tokens, _TOKEN_LIMITS[tier]))
 
-    queue: Queue = Queue()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
     DONE = object()  # sentinel
 
+    def _put(item) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
     def _stream_worker():
         try:
             model = genai.GenerativeModel(
@@ -154,25 +166,22 @@ async def stream_gemini(
             chat = model.start_chat(history=gemini_history)
             for chunk in chat.send_message(message, stream=True):
                 if chunk.text:
-                    queue.put(chunk.text)
+                    _put(chunk.text)
         except Exception as e:
             logger.error(f"Gemini stream error: {e}")
-            queue.put(f"\n[Lỗi: {type(e).__name__}]")
+            _put(f"\n[Lỗi: {type(e).__name__}]")
         finally:
-            queue.put(DONE)
+            _put(DONE)
 
     # Run in daemon thread – không block event loop
     thread = threading.Thread(target=_stream_worker, daemon=True)
     thread.start()
 
     while True:
-        try:
-            item = queue.get_nowait()
-            if item is DONE:
-                break
-            yield item
-        except Empty:
-            await asyncio.sleep(0.05)   # yield control về event loop
+        item = await queue.get()
+        if item is DONE:
+            break
+        yield item
 
 
 # ── Nearby ranking ────────────────────────────────────────────────────────────
@@ -3,12 +3,11 @@ handlers/chat_handler.py – ChatHandler class.
 Trách nhiệm: orchestrate Router + Search + Simple + Gemini cho chat.
 """
 import logging
-from datetime import datetime
 from typing import Optional
 
 from fastapi import WebSocket, WebSocketDisconnect
 
-from ..core.router import QueryRouter, RouteDecision
+from ..core.router import QueryRouter, RouteDecision, current_hour
 from ..core.search import SearchService
 from ..core.simple import SimpleQueryHandler
 from ..core.gemini import GeminiService
@@ -66,9 +65,11 @@ class ChatHandler:
     # ── Private helpers ────────────────────────────────────────────────────────
 
     async def _try_simple(self, message: str, city: str) -> Optional[ChatResponse]:
-        hour   = datetime.now().hour
+        hour   = current_hour()
         search = lambda kw, lim=10: self._search.hybrid_search(city, kw, lim)
-        text, items, handled = await self._simple.handle(message, search, hour)
+        fts    = lambda kw, lim=10: self._search.fts_search(city, kw, lim)
+        multi  = lambda kws, lim=5: self._search.fts_search_multi(city, kws, lim)
+        text, items, handled = await self._simple.handle_cached(message, city, search, hour, fts, multi)
         if not handled:
             return None
         return ChatResponse(reply=text, model_used="local", query_type="simple", results=items)
@@ -98,12 +99,18 @@ class ChatHandler:
         await self._ws_stream_gemini(message, city, decision, history, addr, ws)
 
     async def _ws_try_simple(self, message: str, city: str, ws: WebSocket) -> bool:
-        hour   = datetime.now().hour
+        hour   = current_hour()
         search = lambda kw, lim=10: self._search.hybrid_search(city, kw, lim)
-        text, items, handled = await self._simple.handle(message, search, hour)
+        fts    = lambda kw, lim=10: self._search.fts_search(city, kw, lim)
+        multi  = lambda kws, lim=5: self._search.fts_search_multi(city, kws, lim)
+        items, handled = [], False
+        async for chunk in self._simple.handle_stream(message, city, search, hour, fts, multi):
+            if isinstance(chunk, str):
+                await ws.send_text(chunk)
+            else:
+                items, handled = chunk
         if not handled:
             return False
-        await ws.send_text(text)
         await ws.send_json({"done": True, "model": "local", "type": "simple",
                             "results": [i.model_dump() for i in items]})
         return True
@@ -7,11 +7,15 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
+import faiss
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from .routes import chat, search, ai, system, city
+from .core.search import FAISS_OMP_THREADS
 from .deps import get_search
+from .handlers.suggest_handler import MEAL_KEYWORDS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,8 +23,9 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("🚀 Preloading FAISS indexes…")
-    get_search().preload_all()
+    faiss.omp_set_num_threads(FAISS_OMP_THREADS)   # process-wide → set 1 lần lúc startup, không trong service
+    logger.info("🚀 Preloading SQLite engines + FAISS indexes…")
+    get_search().preload_all(warm_queries=MEAL_KEYWORDS.values())
     logger.info("✅ Ready.")
     yield
     logger.info("Shutdown.")
@@ -31,6 +36,7 @@ app = FastAPI(
     description="AI-powered food assistant cho 6 thành phố Việt Nam.",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,   # orjson serialize list FoodItem nhanh hơn json.dumps
 )
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
@@ -4,15 +4,27 @@ Simple  → template ($0)
 Complex → Gemini Flash (rẻ)
 Heavy   → Gemini Pro (khi cần)
 """
+import os
 import re
+import zlib
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Literal
 
+import numpy as np
+
+try:                        # pyahocorasick (tùy chọn): quét mọi keyword trong 1 lượt
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+from .core.router import current_hour   # dùng chung 1 cache giờ với core.router
+
 ModelTier = Literal["local", "gemini-flash", "gemini-pro"]
 QueryType = Literal["simple", "complex", "heavy"]
 
 
-@dataclass
+@dataclass(frozen=True)
 class RouteDecision:
     model: ModelTier
     max_output_tokens: int
@@ -63,44 +75,156 @@ _HEAVY_PATTERNS = [
     r"(kế hoạch|lịch).+(ăn|bữa).+(cả ngày|hôm nay)",
 ]
 
-_COMPILED_SIMPLE  = [re.compile(p, re.IGNORECASE) for p in _SIMPLE_PATTERNS]
-_COMPILED_COMPLEX = [re.compile(p, re.IGNORECASE) for p in _COMPLEX_PATTERNS]
-_COMPILED_HEAVY   = [re.compile(p, re.IGNORECASE) for p in _HEAVY_PATTERNS]
+def _union(patterns: list[str]) -> re.Pattern:
+    """Gộp list pattern thành 1 alternation → 1 lần scan ở tầng C thay vì N lần search."""
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+_RE_SIMPLE_ANY    = _union(_SIMPLE_PATTERNS)
+_RE_COMPLEX_ANY   = _union(_COMPLEX_PATTERNS)
+_RE_HEAVY_ANY     = _union(_HEAVY_PATTERNS)
+_RE_LOCATION      = re.compile(r"gần|xung quanh|khu vực", re.IGNORECASE)
+
+# _COMPLEX_PATTERNS tách thành trigger literal (Aho-Corasick) + pattern có cấu trúc (regex)
+_LOCATION_KEYWORDS = ["gần", "xung quanh", "khu vực"]
+_COMPLEX_KEYWORDS = [
+    *(f"gần {w}" for w in ("tôi", "đây", "nhất", "chỗ tôi", "vị trí")),
+    *(f"quán {w}" for w in ("gần", "xung quanh", "khu vực")),
+    *(f"tìm {w}" for w in ("quán", "chỗ ăn", "nhà hàng")),
+    *(f"bây giờ {w}" for w in ("nên", "có thể", "muốn")),
+    *(f"{a} {b}" for a in ("tối", "trưa", "sáng", "chiều") for b in ("nay", "hôm nay", "này")),
+    "lúc này", "lúc bây giờ",
+    *(f"{a} {b}" for a in ("đang", "hiện tại") for b in ("muốn", "cần", "tìm")),
+    *(f"chỉ {w}" for w in ("đường", "tôi", "cách đi")),
+    *(f"làm sao {w}" for w in ("đến", "tới", "đi")),
+]
+_RE_COMPLEX_STRUCTURAL = _union([r"trong vòng \d+ (km|phút đi)", r"lúc \d+h", r"vừa .+ vừa"])
+
+
+def _build_automaton():
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for kw in _COMPLEX_KEYWORDS:
+        automaton.add_word(kw, "complex")
+    for kw in _LOCATION_KEYWORDS:
+        automaton.add_word(kw, "location")
+    automaton.make_automaton()
+    return automaton
+
+
+_AUTOMATON = _build_automaton()
+
+
+def _is_complex(q: str, has_location: bool) -> bool:
+    """Location trigger hoặc complex pattern – 1 lượt Aho-Corasick nếu có, không thì regex."""
+    if _AUTOMATON is None:
+        location_trigger = has_location and _RE_LOCATION.search(q) is not None
+        return location_trigger or _RE_COMPLEX_ANY.search(q) is not None
+    tiers = {tier for _, tier in _AUTOMATON.iter(q.lower())}
+    if "complex" in tiers or (has_location and "location" in tiers):
+        return True
+    return _RE_COMPLEX_STRUCTURAL.search(q) is not None
 
 
 # ── Public API ─────────────────────────────────────────────────────────────────
 
+# Query ngắn không chứa chuỗi nào dưới đây thì không pattern heavy/complex/location
+# nào khớp được → trả simple ngay, bỏ qua toàn bộ regex. Phải phủ đủ mọi pattern.
+SHORT_QUERY_LEN = 25
+_COMPLEX_TRIGGERS = (
+    "so sánh", "kế hoạch", "lịch",                              # heavy
+    "gần", "xung quanh", "khu vực", "tìm", "trong vòng",       # location / complex
+    "bây giờ", "nay", "này", "lúc", "đang", "hiện tại", "vừa", "chỉ", "làm sao",
+)
+
+
+# RouteDecision frozen → dùng chung 1 instance / tier
+_DECISIONS: dict[QueryType, RouteDecision] = {
+    "simple":  RouteDecision("local", 256, "simple", "Simple query – dùng template"),
+    "complex": RouteDecision("gemini-flash", 800, "complex", "Query có location/thời gian/đa điều kiện"),
+    "heavy":   RouteDecision("gemini-pro", 1500, "heavy", "Query phức tạp nhiều tầng hoặc quá dài"),
+}
+
+
 def route_query(query: str, has_location: bool = False) -> RouteDecision:
-    """Phân tích query và trả về quyết định model."""
-    q = query.strip()
+    """Phân tích query và trả về quyết định model (cache theo query đã chuẩn hoá)."""
+    return _route_query_cached(query.strip().lower(), has_location)
+
+
+@lru_cache(maxsize=8192)
+def _route_query_cached(q: str, has_location: bool) -> RouteDecision:
+    if _LR is None:
+        return _route_regex(q, has_location)
+    return _route_learned(q, has_location)
+
+
+def _route_regex(q: str, has_location: bool) -> RouteDecision:
     length = len(q)
 
+    # 0. Short-circuit: query ngắn, không có trigger nào → simple (q đã lower)
+    if length < SHORT_QUERY_LEN and not any(t in q for t in _COMPLEX_TRIGGERS):
+        return _DECISIONS["simple"]
+
     # 1. Heavy: rất dài hoặc đa tầng phức tạp
-    if length > 200 or any(p.search(q) for p in _COMPILED_HEAVY):
-        return RouteDecision(
-            model="gemini-pro",
-            max_output_tokens=1500,
-            query_type="heavy",
-            reason="Query phức tạp nhiều tầng hoặc quá dài",
-        )
+    if length > 200 or _RE_HEAVY_ANY.search(q) is not None:
+        return _DECISIONS["heavy"]
 
     # 2. Complex: location / thời gian / đa điều kiện
-    location_trigger = has_location and re.search(r"gần|xung quanh|khu vực", q, re.IGNORECASE)
-    if location_trigger or any(p.search(q) for p in _COMPILED_COMPLEX) or length > 100:
-        return RouteDecision(
-            model="gemini-flash",
-            max_output_tokens=800,
-            query_type="complex",
-            reason="Query có location/thời gian/đa điều kiện",
-        )
+    if _is_complex(q, has_location) or length > 100:
+        return _DECISIONS["complex"]
 
     # 3. Simple: template response, $0
-    return RouteDecision(
-        model="local",
-        max_output_tokens=256,
-        query_type="simple",
-        reason="Simple query – dùng template",
-    )
+    return _DECISIONS["simple"]
+
+
+def _route_learned(q: str, has_location: bool) -> RouteDecision:
+    """Tier do model LR quyết định; luật độ dài / location vẫn áp trước và sau."""
+    length = len(q)
+    if length > 200:
+        return _DECISIONS["heavy"]
+    tier = _lr_tier(q)
+    if tier == "simple" and (length > 100 or (has_location and _RE_LOCATION.search(q))):
+        tier = "complex"
+    return _DECISIONS[tier]
+
+
+# ── Learned router (tùy chọn) ─────────────────────────────────────────────────
+# Logistic regression trên hash char n-gram, train offline bằng train_router.py.
+# Không có file model → route bằng regex như cũ.
+
+ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "./data/router_lr.npz")
+LR_TIERS: tuple[QueryType, ...] = ("simple", "complex", "heavy")
+LR_NGRAMS   = (2, 4)
+LR_FEATURES = 2 ** 14
+
+
+def lr_features(q: str, n_features: int = LR_FEATURES, ngrams: tuple[int, int] = LR_NGRAMS) -> np.ndarray:
+    """Index (crc32 % n_features) của mọi char n-gram trong query; n-gram lặp lại → index lặp lại."""
+    text = f" {q.lower()} "
+    grams = [text[i:i + n] for n in range(ngrams[0], ngrams[1] + 1) for i in range(len(text) - n + 1)]
+    return np.fromiter((zlib.crc32(g.encode()) % n_features for g in grams), dtype=np.int64, count=len(grams))
+
+
+def _load_lr(path: str):
+    """(W [3, n_features], b [3], ngrams) từ file .npz, None nếu chưa train."""
+    try:
+        data = np.load(path)
+        return data["W"].astype(np.float32), data["b"].astype(np.float32), tuple(int(n) for n in data["ngrams"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _lr_tier(q: str) -> QueryType:
+    W, b, ngrams = _LR
+    scores = b + W[:, lr_features(q, W.shape[1], ngrams)].sum(axis=1)
+    return LR_TIERS[int(scores.argmax())]
+
+
+_LR = _load_lr(ROUTER_MODEL_PATH)
+
+
+route_query.cache_clear = _route_query_cached.cache_clear
 
 
 def get_meal_time(hour: int) -> str:
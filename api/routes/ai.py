@@ -1,7 +1,7 @@
 """routes/ai.py – POST /nearby, GET /suggest"""
 from typing import Optional
-from datetime import datetime
 from fastapi import APIRouter, Query, HTTPException
+from ..core.router import current_hour
 from ..deps import get_suggest_handler, get_nearby_handler
 from ..models import SuggestResponse, NearbyRequest, NearbyResponse
 
@@ -14,7 +14,7 @@ async def suggest(
     hour: Optional[int] = Query(default=None, description="Giờ (0-23). Mặc định: giờ server"),
 ):
     try:
-        h = hour if hour is not None else datetime.now().hour
+        h = hour if hour is not None else current_hour()
         return await get_suggest_handler().handle(city, h)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
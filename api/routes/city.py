@@ -14,6 +14,8 @@ from fastapi import APIRouter, HTTPException, Query
 
 from ..deps import get_search
 from ..models import (
+    CategoryStat,
+    DistrictStat,
     DistrictStatsResponse,
     FoodItemRanked,
     PriceDistResponse,
@@ -62,7 +64,12 @@ async def district_stats(city: str):
     try:
         districts = await get_search().district_stats(city)
         total = sum(d["total"] for d in districts)
-        return DistrictStatsResponse(city=city, districts=districts, total_places=total)
+        # model_construct: dữ liệu từ SQL của mình, bỏ validation lúc dựng response
+        return DistrictStatsResponse.model_construct(
+            city=city,
+            districts=[DistrictStat.model_construct(**d) for d in districts],
+            total_places=total,
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -87,7 +94,7 @@ async def price_distribution(city: str):
     """
     try:
         data = await get_search().price_distribution(city)
-        return PriceDistResponse(city=city, **data)
+        return PriceDistResponse.model_construct(city=city, **data)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -108,7 +115,11 @@ async def category_stats(city: str):
     try:
         cats = await get_search().category_stats(city)
         total = sum(c["total"] for c in cats)
-        return CategoryStatsResponse(city=city, categories=cats, total=total)
+        return CategoryStatsResponse.model_construct(
+            city=city,
+            categories=[CategoryStat.model_construct(**c) for c in cats],
+            total=total,
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -162,7 +173,7 @@ async def random_discovery(
             filters["district"] = district
         if max_price:
             filters["max_price"] = max_price
-        return RandomDiscoveryResponse(city=city, items=items, filters_applied=filters)
+        return RandomDiscoveryResponse.model_construct(city=city, items=items, filters_applied=filters)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -6,6 +6,9 @@ import os
 import sqlite3
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from functools import lru_cache
 from pathlib import Path
 from typing import Optional
@@ -20,9 +23,15 @@ logger = logging.getLogger(__name__)
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 MAX_RESULTS = int(os.getenv("MAX_FAISS_RESULTS", "20"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))   # 0 = mặc định torch
 
 VALID_CITIES = {"ha_noi", "ho_chi_minh", "da_nang", "hai_phong", "ha_long", "thanh_hoa"}
 
+# Pool riêng thay vì default executor: FAISS (nhả GIL, CPU nặng) không tranh chỗ với
+# LIKE query, và cả 2 không tranh với blocking work khác của FastAPI
+_FAISS_POOL = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="faiss")
+_SQL_POOL   = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sqlite")
+
 # ── Model (singleton) ─────────────────────────────────────────────────────────
 
 _embed_model: Optional[SentenceTransformer] = None
@@ -31,22 +40,48 @@ def get_embed_model() -> SentenceTransformer:
     global _embed_model
     if _embed_model is None:
         logger.info("Loading embedding model: multilingual-e5-small …")
+        if EMBED_TORCH_THREADS > 0:
+            import torch
+            torch.set_num_threads(EMBED_TORCH_THREADS)
         _embed_model = SentenceTransformer("intfloat/multilingual-e5-small")
         logger.info("Embedding model loaded.")
     return _embed_model
 
 
+@lru_cache(maxsize=4096)
+def _embed_query(q: str) -> np.ndarray:
+    """Vector (read-only) của query – query phổ biến lặp lại không phải encode lại."""
+    # multilingual-e5 cần prefix "query: "
+    vec = get_embed_model().encode(
+        f"query: {q}", normalize_embeddings=True, show_progress_bar=False
+    ).astype(np.float32)
+    vec.setflags(write=False)
+    return vec
+
+
 # ── FAISS index cache ─────────────────────────────────────────────────────────
 
 _faiss_cache: dict[str, faiss.Index] = {}
 
+HNSW_EF_SEARCH = 64
+# Ưu tiên index do quantize_faiss.py build (SQ8 int8, rồi HNSW) nếu có, cuối cùng là index gốc
+INDEX_FILES = ("index_sq8.faiss", "index_hnsw.faiss", "index.faiss")
+
 def _load_faiss(city: str) -> faiss.Index:
     if city not in _faiss_cache:
-        idx_path = DATA_DIR / city / "index.faiss"
+        candidates = [DATA_DIR / city / name for name in INDEX_FILES]
+        idx_path = next((p for p in candidates if p.exists()), candidates[-1])
         if not idx_path.exists():
             raise FileNotFoundError(f"FAISS index not found: {idx_path}")
         logger.info(f"Loading FAISS index for {city} …")
-        _faiss_cache[city] = faiss.read_index(str(idx_path))
+        try:
+            # mmap read-only: page cache của OS giữ 1 bản dùng chung cho mọi worker process
+            index = faiss.read_index(str(idx_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:    # loại index không hỗ trợ mmap → đọc thường
+            index = faiss.read_index(str(idx_path))
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        _faiss_cache[city] = index
         logger.info(f"FAISS index {city} loaded ({_faiss_cache[city].ntotal} vectors).")
     return _faiss_cache[city]
 
@@ -56,46 +91,161 @@ def _load_faiss(city: str) -> faiss.Index:
 def _db_path(city: str) -> str:
     return str(DATA_DIR / city / "food.db")
 
+# Mỗi thread giữ 1 connection read-only / city (mở 1 lần, tái sử dụng) → reader trong
+# _SQL_POOL / _FAISS_POOL chạy song song nhờ WAL, không cần lock chung theo city.
+# mode=ro: city thiếu food.db → raise thay vì tạo file rỗng.
+_local = threading.local()
+
+_READ_PRAGMAS = """
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+    PRAGMA temp_store=MEMORY;
+"""
+
+def _connect(city: str, mode: str) -> sqlite3.Connection:
+    uri = f"{Path(_db_path(city)).resolve().as_uri()}?mode={mode}"
+    return sqlite3.connect(uri, uri=True)
+
+def _get_conn(city: str) -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(city)
+    if conn is None:
+        conn = _connect(city, "ro")
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_READ_PRAGMAS)
+        conns[city] = conn
+    return conn
+
+def _query(city: str, sql: str, params) -> list[sqlite3.Row]:
+    return _get_conn(city).execute(sql, params).fetchall()
+
+# Thứ tự cột cố định → _row_to_food đọc theo vị trí (không tra tên cột)
+_ITEM_COLS = "id, ten_quan, ten_mon, dia_chi, quan, thanh_pho, gia_min, gia_max, note"
+
+# ── FTS5 (tách từ + bỏ dấu) ──────────────────────────────────────────────────
+# Khác tên với `food_fts` (trigram, api/db/fts.py) – 2 bảng cùng tồn tại trong 1 DB.
+# remove_diacritics 2: "pho" khớp "Phở", "bun cha" khớp "Bún chả".
+
+_FTS_TABLE = "food_fts_word"
+_FTS_DDL = f"""
+    CREATE VIRTUAL TABLE {_FTS_TABLE} USING fts5(
+        ten_quan, ten_mon, content='food', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER {_FTS_TABLE}_ai AFTER INSERT ON food BEGIN
+        INSERT INTO {_FTS_TABLE}(rowid, ten_quan, ten_mon) VALUES (new.id, new.ten_quan, new.ten_mon);
+    END;
+    CREATE TRIGGER {_FTS_TABLE}_ad AFTER DELETE ON food BEGIN
+        INSERT INTO {_FTS_TABLE}({_FTS_TABLE}, rowid, ten_quan, ten_mon)
+        VALUES ('delete', old.id, old.ten_quan, old.ten_mon);
+    END;
+    CREATE TRIGGER {_FTS_TABLE}_au AFTER UPDATE OF ten_quan, ten_mon ON food BEGIN
+        INSERT INTO {_FTS_TABLE}({_FTS_TABLE}, rowid, ten_quan, ten_mon)
+        VALUES ('delete', old.id, old.ten_quan, old.ten_mon);
+        INSERT INTO {_FTS_TABLE}(rowid, ten_quan, ten_mon) VALUES (new.id, new.ten_quan, new.ten_mon);
+    END;
+    INSERT INTO {_FTS_TABLE}({_FTS_TABLE}) VALUES ('rebuild');
+"""
+_FTS_SEARCH_SQL = f"""
+    SELECT {", ".join(f"food.{c}" for c in _ITEM_COLS.split(", "))} FROM food
+    JOIN {_FTS_TABLE} ON {_FTS_TABLE}.rowid = food.id
+    WHERE {_FTS_TABLE} MATCH ?
+    ORDER BY bm25({_FTS_TABLE}), food.so_lan_click DESC
+    LIMIT ?
+"""
+_fts_cities: set[str] = set()   # city đã có {_FTS_TABLE} (tạo lúc preload)
+
+def _ensure_fts(city: str) -> bool:
+    """Tạo + build FTS table cho city nếu chưa có. False nếu SQLite không hỗ trợ FTS5."""
+    # Connection ghi riêng, chỉ dùng lúc preload (mode=rw: không tạo DB mới); bật WAL cho reader
+    with closing(_connect(city, "rw")) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (_FTS_TABLE,)
+        ).fetchone()
+        if not exists:
+            try:
+                conn.executescript(_FTS_DDL)
+            except sqlite3.Error as e:
+                logger.warning(f"FTS5 unavailable for {city}: {e}")
+                return False
+    _fts_cities.add(city)
+    return True
+
+def _fts_match(keyword: str) -> str:
+    """Keyword → 1 phrase FTS5 + prefix (từ cuối gõ dở vẫn khớp), escape dấu nháy kép."""
+    return '"' + keyword.strip().replace('"', '""') + '"*'
+
 def _row_to_food(row: sqlite3.Row) -> FoodItem:
-    return FoodItem(
-        id=row["id"],
-        ten_quan=row["ten_quan"] or "",
-        ten_mon=row["ten_mon"] or "",
-        dia_chi=row["dia_chi"] or "",
-        quan=row["quan"] or "",
-        thanh_pho=row["thanh_pho"] or "",
-        gia_min=row["gia_min"] or 0,
-        gia_max=row["gia_max"] or 0,
-        note=row["note"] or "",
+    """Row (SELECT _ITEM_COLS) → FoodItem, bỏ qua validation (dữ liệu từ DB của mình)."""
+    return FoodItem.model_construct(
+        id=row[0],
+        ten_quan=row[1] or "",
+        ten_mon=row[2] or "",
+        dia_chi=row[3] or "",
+        quan=row[4] or "",
+        thanh_pho=row[5] or "",
+        gia_min=row[6] or 0,
+        gia_max=row[7] or 0,
+        note=row[8] or "",
     )
 
 def _fetch_by_ids(city: str, ids: list[int]) -> list[FoodItem]:
     if not ids:
         return []
-    path = _db_path(city)
-    conn = sqlite3.connect(path)
-    conn.row_factory = sqlite3.Row
     placeholders = ",".join("?" * len(ids))
-    rows = conn.execute(f"SELECT * FROM food WHERE id IN ({placeholders})", ids).fetchall()
-    conn.close()
+    rows = _query(city, f"SELECT {_ITEM_COLS} FROM food WHERE id IN ({placeholders})", ids)
     # Giữ đúng thứ tự relevance từ FAISS
-    row_map = {r["id"]: _row_to_food(r) for r in rows}
+    row_map = {r[0]: _row_to_food(r) for r in rows}
     return [row_map[i] for i in ids if i in row_map]
 
-def _fetch_by_name(city: str, keyword: str, limit: int = 10) -> list[FoodItem]:
+_LIKE_SEARCH_SQL = f"""
+    SELECT {_ITEM_COLS} FROM food
+    WHERE ten_quan LIKE ? OR ten_mon LIKE ?
+    ORDER BY so_lan_click DESC
+    LIMIT ?
+"""
+
+def _query_text(city: str, keyword: str, limit: int, wrap=lambda sql: sql, extra: tuple = ()) -> list:
+    """Nhánh text match: FTS (bỏ dấu, bm25) nếu city có FTS, lỗi MATCH → LIKE.
+    `wrap` nhúng câu SELECT text vào câu lớn hơn (hybrid), `extra` là tham số thêm phía sau.
+    """
+    if city in _fts_cities and keyword.strip():
+        try:
+            return _query(city, wrap(_FTS_SEARCH_SQL), (_fts_match(keyword), limit, *extra))
+        except sqlite3.OperationalError as e:   # keyword không parse được thành MATCH
+            logger.debug(f"FTS fallback to LIKE ({keyword!r}): {e}")
     like = f"%{keyword}%"
-    path = _db_path(city)
-    conn = sqlite3.connect(path)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(
-        """SELECT * FROM food
-            WHERE ten_quan LIKE ? OR ten_mon LIKE ?
-            ORDER BY so_lan_click DESC
-            LIMIT ?""",
-        (like, like, limit),
-    ).fetchall()
-    conn.close()
-    return [_row_to_food(r) for r in rows]
+    return _query(city, wrap(_LIKE_SEARCH_SQL), (like, like, limit, *extra))
+
+def _fetch_by_name(city: str, keyword: str, limit: int = 10) -> list[FoodItem]:
+    return [_row_to_food(r) for r in _query_text(city, keyword, limit)]
+
+def _fetch_hybrid(city: str, ids: list[int], keyword: str, text_limit: int) -> tuple[list[FoodItem], list[FoodItem]]:
+    """1 câu SQL cho cả 2 nguồn của hybrid: (text match như _fetch_by_name, semantic theo thứ tự `ids`)."""
+    placeholders = ",".join("?" * len(ids)) or "NULL"
+
+    def _wrap(text_sql: str) -> str:
+        return f"""SELECT *, 0 AS src FROM ({text_sql})
+            UNION ALL
+            SELECT {_ITEM_COLS}, 1 AS src FROM food WHERE id IN ({placeholders})"""
+    rows = _query_text(city, keyword, text_limit, _wrap, tuple(ids))
+    txt = [_row_to_food(r) for r in rows if r[9] == 0]
+    sem_map = {r[0]: _row_to_food(r) for r in rows if r[9] == 1}
+    return txt, [sem_map[i] for i in ids if i in sem_map]
+
+def _semantic_ids(city: str, query: str, top_k: int) -> list[int]:
+    index = _load_faiss(city)
+    vec = _embed_query(query.strip())[None, :]
+
+    actual_k = min(top_k, index.ntotal)
+    distances, indices = index.search(vec, actual_k)
+
+    # FAISS indices là 0-based → DB id là 1-based (-1 = không đủ k kết quả)
+    row = indices[0]
+    return (row[row >= 0].astype(np.int64) + 1).tolist()
 
 
 # ── Public search functions ───────────────────────────────────────────────────
@@ -109,30 +259,18 @@ async def semantic_search(city: str, query: str, top_k: int = 10) -> list[FoodIt
         raise ValueError(f"Unknown city: {city}")
 
     def _run():
-        model = get_embed_model()
-        index = _load_faiss(city)
-
-        # multilingual-e5 cần prefix "query: "
-        vec = model.encode(f"query: {query}", normalize_embeddings=True)
-        vec = np.array([vec], dtype=np.float32)
+        return _fetch_by_ids(city, _semantic_ids(city, query, top_k))
 
-        actual_k = min(top_k, index.ntotal)
-        distances, indices = index.search(vec, actual_k)
-
-        # FAISS indices là 0-based → DB id là 1-based
-        ids = [int(i) + 1 for i in indices[0] if i >= 0]
-        return _fetch_by_ids(city, ids)
-
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _run)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_FAISS_POOL, _run)
 
 
 async def text_search(city: str, keyword: str, limit: int = 10) -> list[FoodItem]:
     """SQLite LIKE search – nhanh, dùng cho simple queries."""
     if city not in VALID_CITIES:
         raise ValueError(f"Unknown city: {city}")
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_by_name, city, keyword, limit)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_SQL_POOL, _fetch_by_name, city, keyword, limit)
 
 
 async def hybrid_search(city: str, query: str, top_k: int = 10) -> list[FoodItem]:
@@ -140,17 +278,22 @@ async def hybrid_search(city: str, query: str, top_k: int = 10) -> list[FoodItem
     Kết hợp semantic + text search, dedup theo id.
     Ưu tiên text match (exact) trước, sau đó semantic.
     """
-    sem, txt = await asyncio.gather(
-        semantic_search(city, query, top_k),
-        text_search(city, query, top_k // 2),
-    )
-    seen: set[int] = set()
-    merged: list[FoodItem] = []
-    for item in [*txt, *sem]:          # text kết quả ưu tiên
-        if item.id not in seen:
-            seen.add(item.id)
-            merged.append(item)
-    return merged[:top_k]
+    if city not in VALID_CITIES:
+        raise ValueError(f"Unknown city: {city}")
+
+    def _run():
+        # FAISS trước, rồi 1 lượt SQL cho cả id semantic + LIKE (1 job executor thay vì 2)
+        return _fetch_hybrid(city, _semantic_ids(city, query, top_k), query, top_k // 2)
+
+    loop = asyncio.get_running_loop()
+    txt, sem = await loop.run_in_executor(_FAISS_POOL, _run)
+    merged: dict[int, FoodItem] = {}   # dedup theo id, giữ thứ tự chèn
+    for items in (txt, sem):           # text kết quả ưu tiên
+        for item in items:
+            if len(merged) >= top_k:
+                return list(merged.values())
+            merged.setdefault(item.id, item)
+    return list(merged.values())
 
 
 def get_all_cities() -> list[str]:
@@ -163,9 +306,14 @@ def get_all_cities() -> list[str]:
 def preload_all(cities: list[str] | None = None) -> None:
     """Load tất cả FAISS indexes vào RAM khi startup."""
     target = cities or get_all_cities()
+    try:
+        # Load model 1 lần + encode thử: query thật đầu tiên không phải chờ khởi tạo
+        get_embed_model().encode(["query: warmup"], normalize_embeddings=True, show_progress_bar=False)
+    except Exception as e:
+        logger.warning(f"Could not warm up embedding model: {e}")
     for city in target:
         try:
-            get_embed_model()   # model load 1 lần
+            _ensure_fts(city)
             _load_faiss(city)
         except Exception as e:
             logger.warning(f"Could not preload {city}: {e}")
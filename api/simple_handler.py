@@ -9,6 +9,18 @@ from .models import FoodItem
 
 # ── Intent Detection ──────────────────────────────────────────────────────────
 
+# Compile 1 lần khi import – parse_intent chạy mỗi request
+_RE_COMPARE = re.compile(r"so s[aá]nh\s+(.+?)\s+(?:v[aà]|v[oớ]i|vs)\s+(.+?)(?:\s|$)", re.IGNORECASE)
+_RE_PRICE   = re.compile(r"(.+?)\s+(?:gi[aá] bao nhi[eê]u|bao nhi[eê]u ti[eề]n|gi[aá] th[eế] n[aà]o)", re.IGNORECASE)
+_RE_WANT_DIA = re.compile(
+    r"(?:t[oô]i (?:mu[oố]n|th[iíì]ch|c[aầ]n) [aă]n|cho t[oô]i [aă]n|[aă]n\s+)(.+?)(?:\s+ngon)?(?:\s*$|\.)",
+    re.IGNORECASE,
+)
+_RE_WANT_NODIA = re.compile(r"(?:toi (?:muon|thich|can) an|cho toi an|toi an)\s+(.+?)(?:\s*$|\.)", re.IGNORECASE)
+_RE_SUGGEST_TRIGGER = re.compile(r"g[oợ]i [yý]|suggest|recommend|goi y", re.IGNORECASE)
+_RE_SUGGEST_EXTRACT = re.compile(r"(?:g[oợ]i [yý]|goi y|suggest)\s+(?:m[oó]n\s+)?(.+?)(?:\s|$)", re.IGNORECASE)
+
+
 def parse_intent(query: str) -> tuple[str, str, Optional[str]]:
     """
     Trả về (intent, keyword, second_keyword).
@@ -18,28 +30,28 @@ def parse_intent(query: str) -> tuple[str, str, Optional[str]]:
     q = query.lower().strip()
 
     # So sánh giá hai món
-    m = re.search(r"so s[aá]nh\s+(.+?)\s+(?:v[aà]|v[oớ]i|vs)\s+(.+?)(?:\s|$)", q, re.IGNORECASE)
+    m = _RE_COMPARE.search(q)
     if m:
         return "price_compare", m.group(1).strip(), m.group(2).strip()
 
     # Hỏi giá
-    m = re.search(r"(.+?)\s+(?:gi[aá] bao nhi[eê]u|bao nhi[eê]u ti[eề]n|gi[aá] th[eế] n[aà]o)", q, re.IGNORECASE)
+    m = _RE_PRICE.search(q)
     if m:
         return "price_query", m.group(1).strip(), None
 
     # Muốn ăn X – có dấu
-    m = re.search(r"(?:t[oô]i (?:mu[oố]n|th[iíì]ch|c[aầ]n) [aă]n|cho t[oô]i [aă]n|[aă]n\s+)(.+?)(?:\s+ngon)?(?:\s*$|\.)", q, re.IGNORECASE)
+    m = _RE_WANT_DIA.search(q)
     if m:
         return "want_to_eat", m.group(1).strip(), None
 
     # Muốn ăn X – không dấu
-    m = re.search(r"(?:toi (?:muon|thich|can) an|cho toi an|toi an)\s+(.+?)(?:\s*$|\.)", q, re.IGNORECASE)
+    m = _RE_WANT_NODIA.search(q)
     if m:
         return "want_to_eat", m.group(1).strip(), None
 
     # Gợi ý – có và không dấu
-    if re.search(r"g[oợ]i [yý]|suggest|recommend|goi y", q, re.IGNORECASE):
-        m = re.search(r"(?:g[oợ]i [yý]|goi y|suggest)\s+(?:m[oó]n\s+)?(.+?)(?:\s|$)", q, re.IGNORECASE)
+    if _RE_SUGGEST_TRIGGER.search(q):
+        m = _RE_SUGGEST_EXTRACT.search(q)
         return "suggest", (m.group(1).strip() if m else ""), None
 
     return "unknown", q[:40], None
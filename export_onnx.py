@@ -0,0 +1,36 @@
+"""
+export_onnx.py – Export multilingual-e5-small sang ONNX + quantize int8 (chạy 1 lần).
+
+Cần thêm: pip install "optimum[onnxruntime]" onnxruntime
+
+  python export_onnx.py                    # → ./models/e5-onnx/
+  python export_onnx.py --out /opt/e5-onnx
+
+Sau đó set EMBED_ONNX_DIR=<out> để SearchService dùng OnnxEmbedder
+(thiếu onnxruntime hoặc file → tự fallback SentenceTransformer).
+"""
+import argparse
+from pathlib import Path
+
+from api.core.embedding import ONNX_FILE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="intfloat/multilingual-e5-small")
+    parser.add_argument("--out", default="./models/e5-onnx")
+    args = parser.parse_args()
+
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer
+
+    out = Path(args.out)
+    ORTModelForFeatureExtraction.from_pretrained(args.model, export=True).save_pretrained(out)
+    AutoTokenizer.from_pretrained(args.model).save_pretrained(out)
+    quantize_dynamic(str(out / "model.onnx"), str(out / ONNX_FILE), weight_type=QuantType.QInt8)
+    print(f"[ok] {out / ONNX_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+quantize_faiss.py – Build lại FAISS index dạng nén cho từng city pack (chạy 1 lần).
+
+Đọc vectors từ index.faiss hiện có (HNSW/Flat, FP32), build index mới và ghi
+cạnh file gốc. SearchService tự ưu tiên file nén nếu tồn tại.
+
+  python quantize_faiss.py                      # HNSW32,SQ8 cho mọi city
+  python quantize_faiss.py --kind ivfpq ha_noi  # IVF,PQ32 cho 1 city
+  python quantize_faiss.py --kind hnsw          # HNSW32,Flat (không nén, search O(log N))
+  python quantize_faiss.py --kind sq8           # Flat SQ8: int8/chiều, RAM giảm 4×, vẫn quét tuyến tính
+
+Vectors đã normalize → giữ METRIC_INNER_PRODUCT (inner product == cosine).
+"""
+import argparse
+import math
+from pathlib import Path
+
+import faiss
+
+# kind → (tên file output, factory string; "{nlist}" điền theo số vector)
+KINDS: dict[str, tuple[str, str]] = {
+    "hnsw_sq8": ("index_hnsw_sq8.faiss", "HNSW32,SQ8"),
+    "ivfpq":    ("index_ivfpq.faiss",    "IVF{nlist},PQ32"),
+    "hnsw":     ("index_hnsw.faiss",     "HNSW32,Flat"),
+    "sq8":      ("index_sq8.faiss",      "SQ8"),
+}
+PQ_MIN_TRAIN = 256   # PQ 8-bit cần ≥ 256 điểm train cho mỗi sub-quantizer
+HNSW_EF_CONSTRUCTION = 200
+
+
+def quantize_city(city_dir: Path, kind: str) -> None:
+    src = city_dir / "index.faiss"
+    if not src.exists():
+        print(f"[skip] {city_dir.name}: không có index.faiss")
+        return
+    flat = faiss.read_index(str(src))
+    xb   = flat.reconstruct_n(0, flat.ntotal)
+    if kind == "ivfpq" and len(xb) < PQ_MIN_TRAIN:
+        print(f"[skip] {city_dir.name}: {len(xb)} vectors < {PQ_MIN_TRAIN}, không đủ train PQ")
+        return
+
+    out_name, factory = KINDS[kind]
+    nlist = max(1, min(256, int(math.sqrt(len(xb)))))
+    index = faiss.index_factory(flat.d, factory.format(nlist=nlist), faiss.METRIC_INNER_PRODUCT)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.train(xb)
+    index.add(xb)
+    faiss.write_index(index, str(city_dir / out_name))
+    print(f"[ok]   {city_dir.name}: {index.ntotal} vectors → {out_name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cities", nargs="*", help="Tên city (mặc định: tất cả trong data dir)")
+    parser.add_argument("--kind", choices=sorted(KINDS), default="hnsw_sq8")
+    parser.add_argument("--data-dir", default="./data")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    cities   = args.cities or sorted(d.name for d in data_dir.iterdir() if d.is_dir())
+    for city in cities:
+        quantize_city(data_dir / city, args.kind)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""tests/helpers.py – helper dùng chung cho test (import trực tiếp, không qua conftest)."""
+from api.models import FoodItem
+
+
+def make_item(**kw) -> FoodItem:
+    defaults = dict(
+        id=1, ten_quan="Quán Test", ten_mon="Phở", dia_chi="123 Lê Lợi",
+        quan="Quận 1", thanh_pho="Hà Nội", gia_min=50000, gia_max=80000, note=""
+    )
+    defaults.update(kw)
+    return FoodItem(**defaults)
+
+
+# Dựng 1 lần cho cả session – test chỉ đọc, dùng chung tham chiếu
+SAMPLE_ITEMS: tuple[FoodItem, ...] = (
+    make_item(id=1, ten_mon="Phở bò", gia_min=50000, gia_max=80000),
+    make_item(id=2, ten_mon="Bún chả", ten_quan="Bún Chả Lý", gia_min=40000, gia_max=60000),
+    make_item(id=3, ten_mon="Bánh mì", ten_quan="Bánh Mì Hà Nội", gia_min=20000, gia_max=30000),
+)
+
+
+def returns(value):
+    """Stub async trả về `value` cố định – rẻ hơn AsyncMock khi không cần assert call."""
+    async def _stub(*args, **kwargs):
+        return value
+    return _stub
@@ -1,57 +1,135 @@
 """
-tests/test_api.py – Integration tests via FastAPI TestClient.
+tests/test_api.py – Integration tests via httpx.AsyncClient + ASGITransport.
 Kịch bản: tất cả endpoints trả đúng status + schema.
 """
 import pytest
-from unittest.mock import AsyncMock, patch
-from fastapi.testclient import TestClient
+import httpx
+import pytest_asyncio
+from fastapi.responses import ORJSONResponse
+
+from api import deps
+from api.main import app
+from api.core.router import RouteDecision
+from api.handlers.chat_handler import ChatHandler
+from api.handlers.nearby_handler import NearbyHandler
+from api.handlers.search_handler import SearchHandler
+from api.handlers.suggest_handler import SuggestHandler
+
+
+# ── Fakes ──────────────────────────────────────────────────────────────────────
+# Class nhỏ với method async thường thay cho MagicMock/AsyncMock: không ghi lại call,
+# method không tồn tại → AttributeError thay vì âm thầm trả về MagicMock.
+
+class _FakeSearch:
+    def __init__(self, items):
+        self._items = items
+
+    async def hybrid_search(self, city, query, top_k=10):
+        return self._items
+
+    async def text_search(self, city, keyword, limit=10):
+        return self._items
+
+    async def fts_search(self, city, keyword, limit=10):
+        return self._items
+
+    async def fts_search_multi(self, city, keywords, limit=5):
+        return [self._items for _ in keywords]
+
+    def get_all_cities(self):
+        return ["ha_noi", "ho_chi_minh"]
+
+
+class _FakeGemini:
+    async def chat(self, message, city, model, max_tokens, **kwargs):
+        return "Test Gemini reply"
+
+    async def rank_nearby(self, candidates, user_address, city, query):
+        return "Gần nhất: Quán Test"
+
+
+class _FakeSimple:
+    def __init__(self, items):
+        self._reply = ("Template reply", items, True)
+
+    async def handle(self, *args, **kwargs):
+        return self._reply
+
+    async def handle_cached(self, *args, **kwargs):
+        return self._reply
+
+
+class _FakeRouter:
+    _DECISION = RouteDecision("local", 256, "simple", "test")
+
+    def route(self, query, has_location=False):
+        return self._DECISION
+
+    @staticmethod
+    def get_meal_time(hour=None):
+        return "Bữa trưa"
 
 
 # ── Fixtures ───────────────────────────────────────────────────────────────────
 
-@pytest.fixture
+_SINGLETONS = ("_search", "_gemini", "_simple", "_router", "_chat", "_search_h", "_suggest", "_nearby")
+
+
+@pytest.fixture(scope="module")
 def mock_services(sample_items):
-    """Patch tất cả external calls: FAISS, SQLite, Gemini."""
-    with (
-        patch("api.deps._search") as m_search,
-        patch("api.deps._gemini") as m_gemini,
-        patch("api.deps._simple") as m_simple,
-        patch("api.deps._router") as m_router,
-    ):
-        from api.core.router import RouteDecision
-        m_router.route.return_value = RouteDecision("local", 256, "simple", "test")
-        m_router.get_meal_time.return_value = "Bữa trưa"
-        m_search.hybrid_search = AsyncMock(return_value=sample_items)
-        m_search.text_search   = AsyncMock(return_value=sample_items)
-        m_search.get_all_cities.return_value = ["ha_noi", "ho_chi_minh"]
-        m_gemini.chat          = AsyncMock(return_value="Test Gemini reply")
-        m_gemini.rank_nearby   = AsyncMock(return_value="Gần nhất: Quán Test")
-        m_simple.handle        = AsyncMock(return_value=("Template reply", sample_items, True))
-        yield
-
-
-@pytest.fixture
-def client(mock_services):
-    from api.main import app
-    return TestClient(app)
+    """Thay singleton trong api.deps bằng fake (1 lần cho cả module), trả lại bản gốc khi xong.
+
+    Handler singleton giữ tham chiếu tới service lúc import → dựng lại handler trên fake.
+    """
+    items  = list(sample_items)
+    saved  = {name: getattr(deps, name) for name in _SINGLETONS}
+    search, gemini = _FakeSearch(items), _FakeGemini()
+    simple, router = _FakeSimple(items), _FakeRouter()
+    deps._search, deps._gemini, deps._simple, deps._router = search, gemini, simple, router
+    deps._chat     = ChatHandler(router, search, simple, gemini)
+    deps._search_h = SearchHandler(search)
+    deps._suggest  = SuggestHandler(search, gemini)
+    deps._nearby   = NearbyHandler(search, gemini)
+    yield search, gemini, simple, router
+    for name, obj in saved.items():
+        setattr(deps, name, obj)
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="session")
+async def client(mock_services):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        await _warm_routes(c)
+        yield c
+
+
+async def _warm_routes(c: httpx.AsyncClient) -> None:
+    """Gọi mỗi endpoint 1 lần lúc setup → chi phí lần đầu (validator, serializer) không rơi vào test."""
+    await c.get("/health")
+    await c.get("/cities")
+    await c.get("/search?q=a&city=ha_noi")
+    await c.post("/chat", json={"message": "x", "city": "ha_noi"})
+    await c.get("/suggest?city=ha_noi")
+    await c.post("/nearby", json={"query": "x", "city": "ha_noi", "user_address": "x"})
 
 
 # ── /health ────────────────────────────────────────────────────────────────────
 
 class TestHealth:
-    def test_health_ok(self, client):
-        r = client.get("/health")
+    async def test_health_ok(self, client):
+        r = await client.get("/health")
         assert r.status_code == 200
-        assert r.json()["status"] == "ok"
-        assert "time" in r.json()
-        assert "cities" in r.json()
+        body = r.json()
+        assert body["status"] == "ok"
+        assert "time" in body
+        assert "cities" in body
 
 
 # ── /cities ────────────────────────────────────────────────────────────────────
 
 class TestCities:
-    def test_returns_list(self, client):
-        r = client.get("/cities")
+    async def test_returns_list(self, client):
+        r = await client.get("/cities")
         assert r.status_code == 200
         assert isinstance(r.json()["cities"], list)
 
@@ -59,24 +137,30 @@ class TestCities:
 # ── /search ────────────────────────────────────────────────────────────────────
 
 class TestSearch:
-    def test_basic_search(self, client):
-        r = client.get("/search?q=phở&city=ha_noi")
+    async def test_basic_search(self, client):
+        r = await client.get("/search?q=phở&city=ha_noi")
         assert r.status_code == 200
         body = r.json()
         assert "items" in body
         assert "total" in body
         assert body["city"] == "ha_noi"
 
-    def test_missing_q_param(self, client):
-        r = client.get("/search?city=ha_noi")
+    async def test_missing_q_param(self, client):
+        r = await client.get("/search?city=ha_noi")
         assert r.status_code == 422   # validation error
 
+    async def test_serialized_with_orjson(self, client):
+        route = next(r for r in app.routes if getattr(r, "path", "") == "/search")
+        assert route.response_class is ORJSONResponse
+        r = await client.get("/search?q=phở&city=ha_noi")
+        assert r.json()["city"] == "ha_noi"
+
 
 # ── POST /chat ─────────────────────────────────────────────────────────────────
 
 class TestChat:
-    def test_simple_chat(self, client):
-        r = client.post("/chat", json={"message": "tôi muốn ăn phở", "city": "ha_noi"})
+    async def test_simple_chat(self, client):
+        r = await client.post("/chat", json={"message": "tôi muốn ăn phở", "city": "ha_noi"})
         assert r.status_code == 200
         body = r.json()
         assert "reply" in body
@@ -84,44 +168,44 @@ class TestChat:
         assert "query_type" in body
         assert isinstance(body["results"], list)
 
-    def test_chat_with_history(self, client):
-        r = client.post("/chat", json={
+    async def test_chat_with_history(self, client):
+        r = await client.post("/chat", json={
             "message": "còn quán nào khác không?",
             "city": "ha_noi",
             "history": [{"role": "user", "text": "tìm quán phở"}, {"role": "model", "text": "Có nhiều quán!"}],
         })
         assert r.status_code == 200
 
-    def test_empty_message_rejected(self, client):
-        r = client.post("/chat", json={"message": "", "city": "ha_noi"})
+    async def test_empty_message_rejected(self, client):
+        r = await client.post("/chat", json={"message": "", "city": "ha_noi"})
         assert r.status_code == 422
 
-    def test_message_too_long_rejected(self, client):
-        r = client.post("/chat", json={"message": "x" * 1001, "city": "ha_noi"})
+    async def test_message_too_long_rejected(self, client):
+        r = await client.post("/chat", json={"message": "x" * 1001, "city": "ha_noi"})
         assert r.status_code == 422
 
 
 # ── GET /suggest ───────────────────────────────────────────────────────────────
 
 class TestSuggest:
-    def test_suggest_default(self, client):
-        r = client.get("/suggest?city=ha_noi")
+    async def test_suggest_default(self, client):
+        r = await client.get("/suggest?city=ha_noi")
         assert r.status_code == 200
         body = r.json()
         assert "meal_time" in body
         assert "suggestions" in body
         assert "reply" in body
 
-    def test_suggest_with_hour(self, client):
-        r = client.get("/suggest?city=ha_noi&hour=7")
+    async def test_suggest_with_hour(self, client):
+        r = await client.get("/suggest?city=ha_noi&hour=7")
         assert r.status_code == 200
 
 
 # ── POST /nearby ───────────────────────────────────────────────────────────────
 
 class TestNearby:
-    def test_nearby(self, client):
-        r = client.post("/nearby", json={
+    async def test_nearby(self, client):
+        r = await client.post("/nearby", json={
             "query": "phở",
             "city": "ha_noi",
             "user_address": "123 Đinh Tiên Hoàng, Hoàn Kiếm",
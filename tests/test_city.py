@@ -2,8 +2,14 @@
 tests/test_city.py – Unit tests cho 6 City Insights endpoints.
 """
 import pytest
+from types import MappingProxyType
 from unittest.mock import AsyncMock, patch, MagicMock
-from fastapi.testclient import TestClient
+import httpx
+import pytest_asyncio
+
+from api.core.search import SearchService
+from api.main import app
+from tests.helpers import returns
 
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
@@ -17,7 +23,9 @@ def _make_ranked(rank: int) -> dict:
     }
 
 
-RANKED_ITEMS   = [_make_ranked(i) for i in range(1, 4)]
+# Payload dựng 1 lần, đóng băng (MappingProxyType) để mọi mock dùng chung tham chiếu
+_RANKED        = tuple(MappingProxyType(_make_ranked(i)) for i in range(1, 11))
+RANKED_ITEMS   = list(_RANKED[:3])
 DISTRICT_DATA  = [{"quan": "Quận 1", "total": 50}, {"quan": "Quận 3", "total": 30}]
 PRICE_DATA     = {"under_50k": 10, "mid_range": 40, "premium": 20, "avg_price": 95000.0, "total": 70}
 CATEGORY_DATA  = [{"loai_hinh": "Quán ăn", "total": 50, "percentage": 71.4},
@@ -26,56 +34,75 @@ CATEGORY_DATA  = [{"loai_hinh": "Quán ăn", "total": 50, "percentage": 71.4},
 
 # ── Fixtures ───────────────────────────────────────────────────────────────────
 
-@pytest.fixture
+def _configure(m: MagicMock) -> None:
+    # AsyncMock chỉ cho method mà test gán side_effect / assert call; còn lại dùng stub
+    m.top_clicks        = AsyncMock(spec=SearchService.top_clicks, return_value=RANKED_ITEMS)
+    m.district_stats    = AsyncMock(spec=SearchService.district_stats, return_value=DISTRICT_DATA)
+    m.price_distribution= returns(PRICE_DATA)
+    m.category_stats    = returns(CATEGORY_DATA)
+    m.trending          = returns(RANKED_ITEMS)
+    m.random_discovery  = AsyncMock(spec=SearchService.random_discovery, return_value=[])
+    m.get_all_cities    = MagicMock(return_value=["ha_noi", "ho_chi_minh"])
+    # preload_all cần thiết cho lifespan
+    m.preload_all       = MagicMock()
+
+
+@pytest.fixture(scope="module")
 def mock_search():
-    """Patch singleton _search trong deps."""
+    """Patch singleton _search trong deps (1 lần cho cả module)."""
     with patch("api.deps._search") as m:
-        m.top_clicks        = AsyncMock(return_value=RANKED_ITEMS)
-        m.district_stats    = AsyncMock(return_value=DISTRICT_DATA)
-        m.price_distribution= AsyncMock(return_value=PRICE_DATA)
-        m.category_stats    = AsyncMock(return_value=CATEGORY_DATA)
-        m.trending          = AsyncMock(return_value=RANKED_ITEMS)
-        m.random_discovery  = AsyncMock(return_value=[])
-        m.get_all_cities    = MagicMock(return_value=["ha_noi", "ho_chi_minh"])
-        # preload_all cần thiết cho lifespan
-        m.preload_all       = MagicMock()
+        _configure(m)
         yield m
 
 
-@pytest.fixture
-def client(mock_search):
-    from api.main import app
-    return TestClient(app)
+@pytest_asyncio.fixture(scope="module", loop_scope="session")
+async def client(mock_search):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        # Gọi mỗi endpoint 1 lần lúc setup → chi phí lần đầu không rơi vào test
+        for path in ("top-clicks", "districts", "price-range", "categories", "trending", "random"):
+            await c.get(f"/city/ha_noi/{path}")
+        mock_search.reset_mock()
+        _configure(mock_search)
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def reset_mocks(mock_search):
+    """Test có thể thay method/side_effect của mock → dựng lại cấu hình gốc sau mỗi test."""
+    yield
+    mock_search.reset_mock()
+    _configure(mock_search)
 
 
 # ── Tests: /city/{city}/top-clicks ────────────────────────────────────────────
 
 class TestTopClicks:
-    def test_returns_list(self, client):
-        r = client.get("/city/ha_noi/top-clicks")
+    async def test_returns_list(self, client):
+        r = await client.get("/city/ha_noi/top-clicks")
         assert r.status_code == 200
         body = r.json()
         assert isinstance(body, list)
         assert body[0]["rank"] == 1
         assert "so_lan_click" in body[0]
 
-    def test_limit_respected(self, client, mock_search):
-        mock_search.top_clicks = AsyncMock(return_value=[_make_ranked(1)])
-        r = client.get("/city/ha_noi/top-clicks?limit=1")
+    async def test_limit_respected(self, client, mock_search):
+        mock_search.top_clicks = AsyncMock(return_value=[_RANKED[0]])
+        r = await client.get("/city/ha_noi/top-clicks?limit=1")
         assert r.status_code == 200
         mock_search.top_clicks.assert_called_once_with("ha_noi", 1)
 
-    def test_invalid_city(self, client, mock_search):
+    async def test_invalid_city(self, client, mock_search):
         mock_search.top_clicks.side_effect = ValueError("Unknown city: xyz")
-        r = client.get("/city/xyz/top-clicks")
+        r = await client.get("/city/xyz/top-clicks")
         assert r.status_code == 400
 
 
 # ── Tests: /city/{city}/districts ─────────────────────────────────────────────
 
 class TestDistrictStats:
-    def test_returns_districts_response(self, client):
-        r = client.get("/city/ha_noi/districts")
+    async def test_returns_districts_response(self, client):
+        r = await client.get("/city/ha_noi/districts")
         assert r.status_code == 200
         body = r.json()
         assert body["city"] == "ha_noi"
@@ -83,31 +110,31 @@ class TestDistrictStats:
         assert "total_places" in body
         assert body["total_places"] == 80   # 50 + 30
 
-    def test_district_fields(self, client):
-        r = client.get("/city/ha_noi/districts")
+    async def test_district_fields(self, client):
+        r = await client.get("/city/ha_noi/districts")
         first = r.json()["districts"][0]
         assert "quan" in first
         assert "total" in first
 
-    def test_invalid_city(self, client, mock_search):
+    async def test_invalid_city(self, client, mock_search):
         mock_search.district_stats.side_effect = ValueError("Unknown city: bad")
-        r = client.get("/city/bad/districts")
+        r = await client.get("/city/bad/districts")
         assert r.status_code == 400
 
 
 # ── Tests: /city/{city}/price-range ───────────────────────────────────────────
 
 class TestPriceDistribution:
-    def test_returns_price_fields(self, client):
-        r = client.get("/city/ha_noi/price-range")
+    async def test_returns_price_fields(self, client):
+        r = await client.get("/city/ha_noi/price-range")
         assert r.status_code == 200
         body = r.json()
         assert body["city"] == "ha_noi"
         for field in ("under_50k", "mid_range", "premium", "avg_price", "total"):
             assert field in body
 
-    def test_values_match_mock(self, client):
-        r = client.get("/city/ha_noi/price-range")
+    async def test_values_match_mock(self, client):
+        r = await client.get("/city/ha_noi/price-range")
         body = r.json()
         assert body["under_50k"] == 10
         assert body["premium"]   == 20
@@ -117,15 +144,15 @@ class TestPriceDistribution:
 # ── Tests: /city/{city}/categories ────────────────────────────────────────────
 
 class TestCategoryStats:
-    def test_returns_categories(self, client):
-        r = client.get("/city/ha_noi/categories")
+    async def test_returns_categories(self, client):
+        r = await client.get("/city/ha_noi/categories")
         assert r.status_code == 200
         body = r.json()
         assert "categories" in body
         assert body["total"] == 70  # 50 + 20
 
-    def test_percentage_field(self, client):
-        r = client.get("/city/ha_noi/categories")
+    async def test_percentage_field(self, client):
+        r = await client.get("/city/ha_noi/categories")
         first = r.json()["categories"][0]
         assert "percentage" in first
 
@@ -133,8 +160,8 @@ class TestCategoryStats:
 # ── Tests: /city/{city}/trending ──────────────────────────────────────────────
 
 class TestTrending:
-    def test_returns_ranked_list(self, client):
-        r = client.get("/city/ha_noi/trending")
+    async def test_returns_ranked_list(self, client):
+        r = await client.get("/city/ha_noi/trending")
         assert r.status_code == 200
         body = r.json()
         assert isinstance(body, list)
@@ -142,9 +169,9 @@ class TestTrending:
             assert "rank" in body[0]
             assert "so_lan_click" in body[0]
 
-    def test_limit_param(self, client, mock_search):
-        mock_search.trending = AsyncMock(return_value=[_make_ranked(1)])
-        r = client.get("/city/ha_noi/trending?limit=5")
+    async def test_limit_param(self, client, mock_search):
+        mock_search.trending = AsyncMock(return_value=[_RANKED[0]])
+        r = await client.get("/city/ha_noi/trending?limit=5")
         assert r.status_code == 200
         mock_search.trending.assert_called_once_with("ha_noi", 5)
 
@@ -152,22 +179,22 @@ class TestTrending:
 # ── Tests: /city/{city}/random ────────────────────────────────────────────────
 
 class TestRandomDiscovery:
-    def test_basic_random(self, client):
-        r = client.get("/city/ha_noi/random")
+    async def test_basic_random(self, client):
+        r = await client.get("/city/ha_noi/random")
         assert r.status_code == 200
         body = r.json()
         assert "city" in body
         assert "items" in body
         assert "filters_applied" in body
 
-    def test_with_filters(self, client, mock_search):
-        r = client.get("/city/ha_noi/random?district=Quận+1&max_price=100000")
+    async def test_with_filters(self, client, mock_search):
+        r = await client.get("/city/ha_noi/random?district=Quận+1&max_price=100000")
         assert r.status_code == 200
         body = r.json()
         assert body["filters_applied"].get("district") == "Quận 1"
         assert body["filters_applied"].get("max_price") == 100000
         mock_search.random_discovery.assert_called_once_with("ha_noi", "Quận 1", 100000, 5)
 
-    def test_no_filters(self, client, mock_search):
-        r = client.get("/city/ha_noi/random")
+    async def test_no_filters(self, client, mock_search):
+        r = await client.get("/city/ha_noi/random")
         mock_search.random_discovery.assert_called_once_with("ha_noi", None, None, 5)
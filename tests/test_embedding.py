@@ -0,0 +1,80 @@
+"""
+tests/test_embedding.py – Unit tests cho EmbeddingBatcher (fake model).
+Kịch bản: query đồng thời được gom chung 1 lần encode, kết quả trả đúng query.
+"""
+import asyncio
+import pytest
+import numpy as np
+
+from api.core.embedding import EmbeddingBatcher
+
+
+class _FakeModel:
+    """Encode mỗi text thành vector [len(text)] và ghi lại từng batch."""
+
+    def __init__(self):
+        self.batches: list[list[str]] = []
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32, show_progress_bar=True):
+        self.batches.append(list(texts))
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+
+class TestEmbeddingBatcher:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_one_batch(self):
+        model   = _FakeModel()
+        batcher = EmbeddingBatcher(lambda: model, window=0.05)
+        vecs = await asyncio.gather(*(batcher.encode(q) for q in ["a", "bb", "ccc"]))
+        assert len(model.batches) == 1
+        assert model.batches[0] == ["query: a", "query: bb", "query: ccc"]
+        assert [float(v[0]) for v in vecs] == [8.0, 9.0, 10.0]
+
+    @pytest.mark.asyncio
+    async def test_max_batch_splits(self):
+        model   = _FakeModel()
+        batcher = EmbeddingBatcher(lambda: model, max_batch=2, window=0.05)
+        await asyncio.gather(*(batcher.encode(q) for q in ["a", "b", "c"]))
+        assert [len(b) for b in model.batches] == [2, 1]
+
+    @pytest.mark.asyncio
+    async def test_encode_error_propagates(self):
+        def _broken():
+            raise RuntimeError("model down")
+        batcher = EmbeddingBatcher(_broken, window=0.0)
+        with pytest.raises(RuntimeError, match="model down"):
+            await batcher.encode("phở")
+
+    @pytest.mark.asyncio
+    async def test_repeat_query_hits_cache(self):
+        model   = _FakeModel()
+        batcher = EmbeddingBatcher(lambda: model, window=0.0, cache_size=1)
+        await batcher.encode("phở")
+        await batcher.encode("phở")
+        await batcher.encode("bún")
+        await batcher.encode("phở")     # đã bị evict bởi "bún"
+        assert model.batches == [["query: phở"], ["query: bún"], ["query: phở"]]
+
+
+class TestOnnxEmbedder:
+
+    def test_mean_pool_ignores_padding(self):
+        from api.core.embedding import OnnxEmbedder
+        hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+        mask   = np.array([[1, 1, 0]])
+        pooled = OnnxEmbedder._mean_pool(hidden, mask)
+        assert pooled.tolist() == [[2.0, 3.0]]
+
+
+class TestWarm:
+
+    @pytest.mark.asyncio
+    async def test_warmed_queries_skip_encode(self):
+        model   = _FakeModel()
+        batcher = EmbeddingBatcher(lambda: model, window=0.0, cache_size=0)
+        batcher.warm(["cơm bún mì", "cơm bún mì", ""])
+        assert model.batches == [["query: cơm bún mì"]]
+        vec = await batcher.encode("cơm bún mì")
+        assert float(vec[0]) == len("query: cơm bún mì")
+        assert len(model.batches) == 1
@@ -0,0 +1,99 @@
+"""
+tests/test_gemini.py – Unit tests cho GeminiService (fake model, không gọi API).
+Kịch bản: stream đủ + đúng thứ tự, lỗi trả về thông báo; chat/chat_many qua async SDK.
+"""
+import pytest
+from types import SimpleNamespace
+
+from api.core.gemini import GeminiService
+from api.core.prompt import PromptBuilder
+
+
+class _FakeChat:
+    def __init__(self, chunks, error=None):
+        self._chunks, self._error = chunks, error
+
+    def send_message(self, message, stream=False):
+        for text in self._chunks:
+            yield SimpleNamespace(text=text)
+        if self._error:
+            raise self._error
+
+    async def send_message_async(self, message):
+        if self._error:
+            raise self._error
+        return SimpleNamespace(text=f"re: {message}")
+
+
+class _FakeModel:
+    def __init__(self, chunks, error=None):
+        self._chat = _FakeChat(chunks, error)
+
+    def start_chat(self, history=None):
+        return self._chat
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    def _make(chunks, error=None):
+        svc = GeminiService(api_key="test", prompt_builder=PromptBuilder())
+        monkeypatch.setattr(svc, "_build_model", lambda *a: _FakeModel(chunks, error))
+        return svc
+    return _make
+
+
+async def _collect(svc) -> list[str]:
+    return [c async for c in svc.stream("phở", "ha_noi", "gemini-flash", 800)]
+
+
+class TestStream:
+
+    @pytest.mark.asyncio
+    async def test_yields_all_chunks_in_order(self, make_service):
+        out = await _collect(make_service(["Xin ", "chào", "!"]))
+        assert "".join(out) == "Xin chào!"
+
+    @pytest.mark.asyncio
+    async def test_error_reported_after_partial_output(self, make_service):
+        out = await _collect(make_service(["Phở "], error=RuntimeError("boom")))
+        text = "".join(out)
+        assert text.startswith("Phở ")
+        assert "[Lỗi: RuntimeError]" in text
+
+    @pytest.mark.asyncio
+    async def test_fast_chunks_are_coalesced(self, make_service):
+        chunks = ["x" * 10] * 20
+        out = await _collect(make_service(chunks))
+        assert "".join(out) == "".join(chunks)
+        assert len(out) < len(chunks)
+
+
+class TestBuildParams:
+
+    def test_system_is_stable_and_preamble_leads_history(self):
+        svc = GeminiService(api_key="test", prompt_builder=PromptBuilder())
+        history = [{"role": "user", "text": "hi"}, {"role": "model", "text": "chào"}]
+        system, hist, _ = svc._build_params(
+            "gemini-flash", "ha_noi", 800, history, None, "12 Lê Lợi"
+        )
+        assert "h (" not in system and "Lê Lợi" not in system
+        assert "12 Lê Lợi" in hist[0]["parts"][0]["text"]
+        assert [m["role"] for m in hist] == ["user", "model", "user", "model"]
+        assert hist[2]["parts"][0]["text"] == "hi"
+
+
+class TestChat:
+
+    @pytest.mark.asyncio
+    async def test_chat_uses_async_sdk(self, make_service):
+        assert await make_service([]).chat("phở", "ha_noi", "gemini-flash", 800) == "re: phở"
+
+    @pytest.mark.asyncio
+    async def test_chat_many_keeps_order(self, make_service):
+        out = await make_service([]).chat_many(["a", "b", "c"], "ha_noi", "gemini-flash", 800)
+        assert out == ["re: a", "re: b", "re: c"]
+
+    @pytest.mark.asyncio
+    async def test_chat_error_message(self, make_service):
+        out = await make_service([], error=RuntimeError("x")).chat("phở", "ha_noi", "gemini-flash", 800)
+        assert "RuntimeError" in out
@@ -6,29 +6,43 @@ Kịch bản test theo BA.md:
   - BR3: heavy queries → gemini-pro
 """
 import pytest
+from functools import lru_cache
+
 from api.core.router import QueryRouter
 
-@pytest.fixture
+_ROUTER = QueryRouter()
+
+
+@pytest.fixture(scope="session")
 def router():
-    return QueryRouter()
+    return _ROUTER
+
+
+@lru_cache(maxsize=None)
+def _route(query: str, has_location: bool = False):
+    """Memo kết quả route theo input của bảng test (router là hàm thuần)."""
+    return _ROUTER.route(query, has_location=has_location)
 
 
 class TestSimpleRouting:
     """BR1: simple query → local model, $0 cost."""
 
-    @pytest.mark.parametrize("query", [
+    QUERIES = [
         "tôi muốn ăn phở",
         "toi muon an pho",
         "cho tôi ăn bún chả",
         "gợi ý món nào ngon",
         "phở giá bao nhiêu",
         "so sánh giá bún chả và phở",
-    ])
-    def test_simple_routes_to_local(self, router, query):
-        result = router.route(query)
-        assert result.model == "local", f"Expected local for: {query!r}"
-        assert result.query_type == "simple"
-        assert result.max_output_tokens == 256
+    ]
+
+    def test_simple_routes_to_local(self):
+        # Hàm thuần → 1 test duyệt cả bảng thay vì 1 test item / query
+        for query in self.QUERIES:
+            result = _route(query)
+            assert result.model == "local", f"Expected local for: {query!r}"
+            assert result.query_type == "simple", query
+            assert result.max_output_tokens == 256, query
 
 
 class TestComplexRouting:
@@ -39,38 +53,57 @@ class TestComplexRouting:
         "quán nào gần đây mở lúc này",
         "tối nay nên ăn gì",
     ])
-    def test_complex_routes_to_flash(self, router, query):
-        result = router.route(query)
+    def test_complex_routes_to_flash(self, query):
+        result = _route(query)
         assert result.model == "gemini-flash"
         assert result.query_type == "complex"
         assert result.max_output_tokens <= 800
 
-    def test_location_flag_triggers_complex(self, router):
-        result = router.route("tìm quán gần", has_location=True)
+    def test_location_flag_triggers_complex(self):
+        result = _route("tìm quán gần", has_location=True)
         assert result.model == "gemini-flash"
 
-    def test_long_query_triggers_complex(self, router):
-        result = router.route("a" * 101)
+    def test_long_query_triggers_complex(self):
+        result = _route("a" * 101)
         assert result.model == "gemini-flash"
 
 
 class TestHeavyRouting:
     """BR3: heavy query → gemini-pro."""
 
-    def test_very_long_query_is_heavy(self, router):
-        result = router.route("a" * 201)
+    def test_very_long_query_is_heavy(self):
+        result = _route("a" * 201)
         assert result.model == "gemini-pro"
         assert result.query_type == "heavy"
 
-    def test_multi_compare_is_heavy(self, router):
-        result = router.route("so sánh bún chả với phở và với cơm tấm")
+    def test_multi_compare_is_heavy(self):
+        result = _route("so sánh bún chả với phở và với cơm tấm")
         assert result.model == "gemini-pro"
 
 
+class TestRouteCache:
+    """route() cache theo query chuẩn hoá, RouteDecision không sửa được."""
+
+    def test_normalized_query_hits_cache(self, router):
+        router.cache_clear()
+        first = router.route("Tìm quán phở ")
+        assert router.route("tìm quán phở") is first
+        assert router._route_cached.cache_info().hits == 1
+
+    def test_has_location_is_part_of_key(self, router):
+        assert router.route("phở gần", has_location=True).query_type == "complex"
+        assert router.route("phở gần", has_location=False).query_type == "simple"
+
+    def test_decision_is_frozen(self, router):
+        import dataclasses
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            router.route("tôi muốn ăn phở").model = "gemini-pro"
+
+
 class TestMealTime:
     """get_meal_time trả đúng bữa ăn theo giờ."""
 
-    @pytest.mark.parametrize("hour,expected", [
+    CASES = [
         (6,  "Bữa sáng"),
         (9,  "Bữa sáng"),
         (10, "Bữa trưa"),
@@ -81,6 +114,23 @@ class TestMealTime:
         (20, "Bữa tối"),
         (21, "Ăn đêm"),
         (3,  "Ăn đêm"),
-    ])
-    def test_meal_time_by_hour(self, hour, expected):
-        assert QueryRouter.get_meal_time(hour) == expected
+    ]
+
+    def test_meal_time_by_hour(self):
+        for hour, expected in self.CASES:
+            assert QueryRouter.get_meal_time(hour) == expected, (hour, expected)
+
+
+class TestCurrentHour:
+    """current_hour cache giờ hiện tại, tính lại sau HOUR_CACHE_SECONDS."""
+
+    def test_cached_between_calls(self, monkeypatch):
+        import time
+        from api.core import router
+        monkeypatch.setattr(router, "_hour_cache", {"t": 0.0, "h": 0})
+        calls = []
+        real = time.localtime
+        monkeypatch.setattr(router.time, "localtime", lambda t=None: calls.append(t) or real(t))
+        h1, h2 = router.current_hour(), router.current_hour()
+        assert h1 == h2 == real().tm_hour
+        assert len(calls) == 1
@@ -2,68 +2,141 @@
 tests/test_search.py – Unit tests cho SearchService (mock DB).
 Kịch bản: validate city, merge logic, row parsing.
 """
+import shutil
 import sqlite3
-import tempfile
-import os
 import pytest
 from pathlib import Path
 
-import numpy as np
 
+# ── Global: engine cache theo (city, data_dir) ────────────────────────────────
 
-# ── Global: reset engine cache giữa các test ───────────────────────────────────
-
-@pytest.fixture(autouse=True)
+@pytest.fixture(scope="session", autouse=True)
 def clear_engine_cache():
-    """Xóa SQLAlchemy engine cache trước mỗi test để tránh xung đột."""
+    """Engine cache key theo (city, data_dir) → test khác thư mục không đụng nhau, chỉ dọn cuối session."""
     from api.db import session as sess_module
-    sess_module._engines.clear()
-    sess_module._session_factories.clear()
     yield
+    for engine in sess_module._engines.values():
+        engine.dispose()
     sess_module._engines.clear()
     sess_module._session_factories.clear()
 
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
+# Schema + dữ liệu mẫu trong 1 script → 1 lệnh executescript, 1 transaction
+_SEED_SQL = """
+    CREATE TABLE food (
+      id INTEGER PRIMARY KEY,
+      ten_quan TEXT, ten_mon TEXT, dia_chi TEXT,
+      quan TEXT, thanh_pho TEXT,
+      gia_min INTEGER, gia_max INTEGER,
+      note TEXT, so_lan_click INTEGER DEFAULT 0
+    );
+    BEGIN;
+    INSERT INTO food VALUES (1, 'Phở Hà Nội', 'Phở bò',  '123 Đinh Tiên Hoàng', 'Hoàn Kiếm', 'Hà Nội', 50000, 80000, '', 10);
+    INSERT INTO food VALUES (2, 'Bún Chả Lý', 'Bún chả', '45 Hàng Than',        'Ba Đình',   'Hà Nội', 40000, 60000, '', 5);
+    INSERT INTO food VALUES (3, 'Bánh Mì 25', 'Bánh mì', '25 Đinh Lễ',          'Hoàn Kiếm', 'Hà Nội', 20000, 30000, '', 8);
+    COMMIT;
+"""
+# DB test dùng xong bỏ → không cần fsync / rollback journal trên đĩa
+_SEED_PRAGMAS = "PRAGMA synchronous=OFF; PRAGMA journal_mode=MEMORY;"
+
+
+def _seed(conn) -> None:
+    """Tạo bảng food + dữ liệu mẫu trên 1 connection sqlite3 (file hoặc :memory:)."""
+    conn.executescript(_SEED_SQL)
+
+
 def _create_test_db(path: Path) -> None:
     """Tạo SQLite test DB với dữ liệu mẫu."""
     conn = sqlite3.connect(str(path))
-    conn.execute("""
-        CREATE TABLE food (
-          id INTEGER PRIMARY KEY,
-          ten_quan TEXT, ten_mon TEXT, dia_chi TEXT,
-          quan TEXT, thanh_pho TEXT,
-          gia_min INTEGER, gia_max INTEGER,
-          note TEXT, so_lan_click INTEGER DEFAULT 0
-        )
-    """)
-    conn.executemany("INSERT INTO food VALUES (?,?,?,?,?,?,?,?,?,?)", [
-        (1, "Phở Hà Nội",  "Phở bò",    "123 Đinh Tiên Hoàng", "Hoàn Kiếm", "Hà Nội", 50000, 80000, "", 10),
-        (2, "Bún Chả Lý",  "Bún chả",   "45 Hàng Than",        "Ba Đình",   "Hà Nội", 40000, 60000, "", 5),
-        (3, "Bánh Mì 25",  "Bánh mì",   "25 Đinh Lễ",          "Hoàn Kiếm", "Hà Nội", 20000, 30000, "", 8),
-    ])
-    conn.commit()
+    conn.executescript(_SEED_PRAGMAS)
+    _seed(conn)
     conn.close()
 
 
+def _sql(engine, query: str, params: dict | None = None) -> list:
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        result = conn.execute(text(query), params or {})
+        return result.fetchall() if result.returns_rows else []
+
+
+@pytest.fixture(scope="session")
+def seed_data_dir(tmp_path_factory):
+    """DB mẫu dựng 1 lần mỗi session (mỗi worker xdist) – không ghi trực tiếp."""
+    root = tmp_path_factory.mktemp("data")
+    (root / "ha_noi").mkdir()
+    _create_test_db(root / "ha_noi" / "food.db")
+    return root
+
+
 @pytest.fixture
-def test_data_dir(tmp_path):
-    city_dir = tmp_path / "ha_noi"
-    city_dir.mkdir()
-    _create_test_db(city_dir / "food.db")
+def test_data_dir(seed_data_dir, tmp_path):
+    """Bản copy ghi được của seed_data_dir – cho test cần file thật (PRAGMA, durability)."""
+    shutil.copytree(seed_data_dir, tmp_path, dirs_exist_ok=True)
     return tmp_path
 
 
 @pytest.fixture
-def search_service(test_data_dir, monkeypatch):
+def fresh_engine(test_data_dir):
+    """Bỏ engine cache của test_data_dir trước/sau test → test mở engine (QueuePool + PRAGMA) mới."""
+    from api.db import session as sess_module
+    key = sess_module.engine_key("ha_noi", test_data_dir)
+
+    def _drop():
+        sess_module._session_factories.pop(key, None)
+        engine = sess_module._engines.pop(key, None)
+        if engine is not None:
+            engine.dispose()
+    _drop()
+    yield key
+    _drop()
+
+
+@pytest.fixture
+def memory_engine(seed_data_dir):
+    """Engine SQLite :memory: (StaticPool = 1 connection dùng chung) gắn vào engine cache
+    của (ha_noi, seed_data_dir) – file seed không bao giờ bị mở."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from api.db import session as sess_module
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    raw = engine.raw_connection()
+    try:
+        _seed(raw.driver_connection)
+    finally:
+        raw.close()
+    key = sess_module.engine_key("ha_noi", seed_data_dir)
+    sess_module._engines[key] = engine
+    sess_module._session_factories[key] = sessionmaker(bind=engine, expire_on_commit=False)
+    yield engine
+    sess_module._engines.pop(key, None)
+    sess_module._session_factories.pop(key, None)
+    engine.dispose()
+
+
+def _make_service(data_dir: Path, monkeypatch):
     from api.core.search import SearchService
-    svc = SearchService(data_dir=test_data_dir)
+    svc = SearchService(data_dir=data_dir)
     # Patch VALID_CITIES cho test
     monkeypatch.setattr("api.core.search.VALID_CITIES", {"ha_noi"})
     return svc
 
 
+@pytest.fixture
+def search_service(memory_engine, seed_data_dir, monkeypatch):
+    """SearchService trên DB in-memory; seed_data_dir chỉ dùng cho đường dẫn (không mở file)."""
+    return _make_service(seed_data_dir, monkeypatch)
+
+
+@pytest.fixture
+def disk_search_service(test_data_dir, fresh_engine, monkeypatch):
+    """SearchService trên file SQLite thật (QueuePool + PRAGMA như production)."""
+    return _make_service(test_data_dir, monkeypatch)
+
+
 class TestTextSearch:
     """text_search trả về kết quả khớp."""
 
@@ -121,15 +194,12 @@ class TestMerge:
 class TestRowToItem:
     """_orm_to_item chuyển đúng SQLAlchemy Food object sang FoodItem."""
 
-    def test_row_conversion(self, test_data_dir, monkeypatch):
-        from api.core.search import SearchService
+    def test_row_conversion(self, search_service, seed_data_dir):
         from api.db.models import Food
         from api.db.session import db_session
-        monkeypatch.setattr("api.core.search.VALID_CITIES", {"ha_noi"})
-        svc = SearchService(data_dir=test_data_dir)
-        with db_session("ha_noi", test_data_dir) as session:
+        with db_session("ha_noi", seed_data_dir) as session:
             food = session.get(Food, 1)
-        item = svc._orm_to_item(food)
+        item = search_service._orm_to_item(food)
         assert item.id == 1
         assert item.ten_mon == "Phở bò"
         assert item.gia_min == 50000
@@ -159,11 +229,279 @@ class TestIncrementClick:
         with pytest.raises(ValueError, match="Unknown city"):
             await search_service.increment_click("invalid_city", 1)
 
-    def test_click_persisted_in_db(self, search_service, test_data_dir):
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_click_persisted_in_db(self, disk_search_service, test_data_dir):
         """Đảm bảo thay đổi được ghi vào file SQLite (không chỉ in-memory)."""
-        import asyncio
-        asyncio.run(search_service.increment_click("ha_noi", 3))
+        await disk_search_service.increment_click("ha_noi", 3)
         conn = sqlite3.connect(str(test_data_dir / "ha_noi" / "food.db"))
         row  = conn.execute("SELECT so_lan_click FROM food WHERE id=3").fetchone()
         conn.close()
         assert row[0] == 9   # ban đầu là 8, +1 = 9
+
+
+class TestCategoryStats:
+    """category_stats đếm đúng theo khoảng giá (1 query aggregate)."""
+
+    @pytest.mark.asyncio
+    async def test_bucket_counts(self, search_service):
+        stats  = await search_service.category_stats("ha_noi")
+        counts = {s["loai_hinh"]: s["total"] for s in stats}
+        assert counts["Bình dân (< 50k)"] == 2
+        assert counts["Tầm trung (50k–150k)"] == 1
+        assert counts["Cao cấp (> 150k)"] == 0
+        assert stats[0]["percentage"] == 66.7
+
+    def test_ensure_indexes_creates_gia_min_index(self, search_service, memory_engine):
+        search_service._ensure_indexes("ha_noi")
+        names = {r[0] for r in _sql(memory_engine, "SELECT name FROM sqlite_master WHERE type='index'")}
+        assert "idx_food_gia_min" in names
+
+
+class TestInsightsCache:
+    """City insights được cache theo TTL, click làm mới cache phụ thuộc click."""
+
+    @pytest.mark.asyncio
+    async def test_repeat_call_served_from_cache(self, search_service, monkeypatch):
+        first = await search_service.top_clicks("ha_noi", 3)
+
+        def _fail(*a):
+            raise AssertionError("không được query lại DB")
+        monkeypatch.setattr(search_service, "_fetch_top_clicks", _fail)
+        assert await search_service.top_clicks("ha_noi", 3) is first
+
+    @pytest.mark.asyncio
+    async def test_kwargs_part_of_key(self, search_service):
+        two = await search_service.top_clicks("ha_noi", limit=2)
+        assert len(two) == 2
+        assert await search_service.top_clicks("ha_noi", limit=2) is two
+        assert len(await search_service.top_clicks("ha_noi", limit=3)) == 3
+
+    @pytest.mark.asyncio
+    async def test_click_invalidates_top_clicks(self, search_service):
+        before = await search_service.top_clicks("ha_noi", 3)
+        assert before[0]["id"] == 1
+        for _ in range(6):
+            await search_service.increment_click("ha_noi", 3)   # 8 → 14 > 10
+        after = await search_service.top_clicks("ha_noi", 3)
+        assert after[0]["id"] == 3
+
+
+class TestRankedInsights:
+    """top_clicks/trending: rank từ ROW_NUMBER() trong SQL."""
+
+    @pytest.mark.asyncio
+    async def test_ranks_follow_clicks(self, search_service):
+        rows = await search_service.top_clicks("ha_noi", 3)
+        assert [(r["id"], r["rank"], r["so_lan_click"]) for r in rows] == [(1, 1, 10), (3, 2, 8), (2, 3, 5)]
+
+    def test_trending_skips_unclicked(self, search_service, memory_engine):
+        _sql(memory_engine, "UPDATE food SET so_lan_click = 0 WHERE id = 3")
+        rows = search_service._fetch_trending("ha_noi", 10)
+        assert [(r["id"], r["rank"]) for r in rows] == [(1, 1), (2, 2)]
+
+
+class TestStaticAggregates:
+    """district/price/category tính sẵn lúc preload, không query lại DB."""
+
+    @pytest.mark.asyncio
+    async def test_precomputed_served_without_db(self, search_service, monkeypatch):
+        search_service._precompute_aggregates("ha_noi")
+
+        def _fail(*a):
+            raise AssertionError("không được query lại DB")
+        for name in ("_fetch_district_stats", "_fetch_price_dist", "_fetch_category_stats"):
+            monkeypatch.setattr(search_service, name, _fail)
+        districts = await search_service.district_stats("ha_noi")
+        assert districts[0] == {"quan": "Hoàn Kiếm", "total": 2}
+        assert (await search_service.price_distribution("ha_noi"))["total"] == 3
+
+    @pytest.mark.asyncio
+    async def test_not_invalidated_by_click(self, search_service):
+        first = await search_service.category_stats("ha_noi")
+        await search_service.increment_click("ha_noi", 1)
+        assert await search_service.category_stats("ha_noi") is first
+
+
+class TestHybridShortCircuit:
+    """hybrid_search bỏ qua semantic khi text đã đủ top_k."""
+
+    @pytest.mark.asyncio
+    async def test_semantic_cancelled_when_text_enough(self, search_service, monkeypatch):
+        import asyncio
+
+        cancelled = []
+
+        async def _slow_semantic(city, query, top_k=10):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            raise AssertionError("semantic không được chạy hết")
+        monkeypatch.setattr(search_service, "semantic_search", _slow_semantic)
+        results = await search_service.hybrid_search("ha_noi", "Hà Nội", top_k=1)
+        assert len(results) == 1
+        assert cancelled == [True]   # task đã được await xong trước khi return
+
+    @pytest.mark.asyncio
+    async def test_semantic_fills_remaining(self, search_service, monkeypatch, sample_items):
+        async def _semantic(city, query, top_k=10):
+            return sample_items
+        monkeypatch.setattr(search_service, "semantic_search", _semantic)
+        results = await search_service.hybrid_search("ha_noi", "Phở", top_k=5)
+        assert results[0].ten_mon == "Phở bò"
+        assert len(results) == 3
+
+
+class TestFetchByIds:
+    """_fetch_by_ids giữ đúng thứ tự FAISS, bỏ id không tồn tại."""
+
+    def test_order_preserved_and_missing_skipped(self, search_service):
+        items = search_service._fetch_by_ids("ha_noi", [3, 99, 1, 2])
+        assert [i.id for i in items] == [3, 1, 2]
+
+    def test_all_missing(self, search_service):
+        assert search_service._fetch_by_ids("ha_noi", [98, 99]) == []
+
+
+class TestFtsSearch:
+    """text_search qua FTS5 trigram sau khi _ensure_indexes tạo food_fts."""
+
+    @pytest.mark.asyncio
+    async def test_fts_matches_case_insensitive(self, search_service):
+        search_service._ensure_indexes("ha_noi")
+        assert "ha_noi" in search_service._fts_cities
+        results = await search_service.text_search("ha_noi", "bún chả")
+        assert [r.ten_quan for r in results] == ["Bún Chả Lý"]
+
+    @pytest.mark.asyncio
+    async def test_fts_escapes_match_syntax(self, search_service):
+        search_service._ensure_indexes("ha_noi")
+        assert await search_service.text_search("ha_noi", 'Phở" OR "a') == []
+
+    @pytest.mark.asyncio
+    async def test_fts_tracks_updates(self, search_service, memory_engine):
+        search_service._ensure_indexes("ha_noi")
+        _sql(memory_engine, "UPDATE food SET ten_mon='Cơm tấm' WHERE id=3")
+        results = await search_service.text_search("ha_noi", "cơm tấm")
+        assert [r.id for r in results] == [3]
+
+    def test_failed_ddl_rolls_back(self, search_service, memory_engine, monkeypatch):
+        from api.db import fts
+        monkeypatch.setattr(fts, "_DDL", [*fts._DDL[:2], "CREATE TRIGGER broken", *fts._DDL[2:]])
+        search_service._ensure_indexes("ha_noi")
+        assert "ha_noi" not in search_service._fts_cities
+        assert _sql(memory_engine, "SELECT name FROM sqlite_master WHERE name LIKE 'food_fts%'") == []
+
+
+class TestIncrementClickConcurrent:
+    """UPDATE nguyên tử: click đồng thời không bị mất."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_increments_not_lost(self, disk_search_service):
+        # Cần DB file: StaticPool chỉ có 1 connection, không chạy transaction song song được
+        import asyncio
+        svc    = disk_search_service
+        counts = await asyncio.gather(*(svc.increment_click("ha_noi", 1) for _ in range(20)))
+        assert sorted(counts) == list(range(11, 31))
+
+
+class TestRandomDiscovery:
+    """random_discovery lấy mẫu theo id, vẫn tôn trọng filter."""
+
+    @pytest.mark.asyncio
+    async def test_returns_distinct_items(self, search_service):
+        results = await search_service.random_discovery("ha_noi", limit=2)
+        assert len(results) == 2
+        assert len({r.id for r in results}) == 2
+
+    @pytest.mark.asyncio
+    async def test_filters_applied(self, search_service):
+        results = await search_service.random_discovery("ha_noi", district="Ba Đình", limit=5)
+        assert [r.id for r in results] == [2]
+        results = await search_service.random_discovery("ha_noi", max_price=25000, limit=5)
+        assert [r.id for r in results] == [3]
+
+    @pytest.mark.asyncio
+    async def test_district_case_insensitive_and_no_match(self, search_service):
+        results = await search_service.random_discovery("ha_noi", district="hoàn kiếm", limit=5)
+        assert sorted(r.id for r in results) == [1, 3]
+        assert await search_service.random_discovery("ha_noi", district="Cầu Giấy") == []
+
+
+class TestPreloadAll:
+    """preload_all: lỗi tạo index (DDL) không làm bỏ qua việc load FAISS."""
+
+    def test_faiss_loaded_when_ddl_fails(self, search_service, monkeypatch):
+        loaded = []
+
+        def _ddl_fail(city):
+            raise RuntimeError("attempt to write a readonly database")
+        monkeypatch.setattr(search_service, "_get_model", lambda: None)
+        monkeypatch.setattr(search_service, "_prefetch_index", lambda city: None)
+        monkeypatch.setattr(search_service, "_ensure_indexes", _ddl_fail)
+        monkeypatch.setattr(search_service, "_load_faiss", loaded.append)
+        search_service.preload_all()
+        assert loaded == ["ha_noi"]
+
+
+class TestLazyLoadLocking:
+    """_get_model chỉ load 1 lần dù nhiều thread gọi đồng thời."""
+
+    def test_model_loaded_once(self, search_service, monkeypatch):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        calls = []
+
+        def _slow_load():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+        monkeypatch.setattr(search_service, "_load_model", _slow_load)
+        with ThreadPoolExecutor(8) as pool:
+            models = list(pool.map(lambda _: search_service._get_model(), range(8)))
+        assert len(calls) == 1
+        assert all(m is models[0] for m in models)
+
+
+class TestEnginePragmas:
+    """_get_engine bật PRAGMA tối ưu đọc trên mỗi connection."""
+
+    def test_pragmas_applied(self, test_data_dir, fresh_engine):
+        from sqlalchemy import text
+        from api.db.session import db_session
+        with db_session("ha_noi", test_data_dir) as session:
+            assert session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert session.execute(text("PRAGMA cache_size")).scalar() == -64000
+            assert session.execute(text("PRAGMA temp_store")).scalar() == 2
+            assert session.execute(text("PRAGMA query_only")).scalar() == 0
+
+
+class TestPreloadEngines:
+    """preload_engines tạo sẵn engine cho city có DB, bỏ qua city lỗi."""
+
+    def test_preload_engines_warms_cache(self, test_data_dir, fresh_engine):
+        from api.db import session as sess_module
+        sess_module.preload_engines(test_data_dir, ["ha_noi", "missing_city"])
+        assert fresh_engine in sess_module._engines
+
+
+class TestFtsSearchRanked:
+    """fts_search: MATCH theo bm25, [] khi chưa có FTS hoặc keyword ngắn."""
+
+    @pytest.mark.asyncio
+    async def test_requires_fts_table(self, search_service):
+        assert await search_service.fts_search("ha_noi", "phở bò") == []
+        search_service._ensure_indexes("ha_noi")
+        results = await search_service.fts_search("ha_noi", "phở bò")
+        assert [r.id for r in results] == [1]
+        assert await search_service.fts_search("ha_noi", "bò") == []
+
+    @pytest.mark.asyncio
+    async def test_multi_keywords_single_query(self, search_service):
+        search_service._ensure_indexes("ha_noi")
+        phos, buns, short = await search_service.fts_search_multi("ha_noi", ["phở", "bún chả", "bò"], 5)
+        assert [r.id for r in phos] == [1]
+        assert [r.id for r in buns] == [2]
+        assert short == []
@@ -9,25 +9,33 @@ import pytest
 from api.core.simple import SimpleQueryHandler
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def handler():
     return SimpleQueryHandler()
 
 
+@pytest.fixture
+def fresh_handler():
+    """Handler riêng cho test kiểm tra state cache kết quả (handle_cached)."""
+    return SimpleQueryHandler()
+
+
 class TestParseIntent:
     """parse_intent trả về đúng (intent, keyword, keyword2)."""
 
     # UC1 – want_to_eat
-    @pytest.mark.parametrize("query,expected_kw", [
+    WANT_TO_EAT = [
         ("tôi muốn ăn phở",         "phở"),
         ("toi muon an bun cha",      "bun cha"),
         ("cho tôi ăn cơm tấm",      "cơm tấm"),
         ("cho toi an bun",           "bun"),
-    ])
-    def test_want_to_eat(self, handler, query, expected_kw):
-        intent, kw, _ = handler.parse_intent(query)
-        assert intent == "want_to_eat"
-        assert expected_kw in kw
+    ]
+
+    def test_want_to_eat(self, handler):
+        for query, expected_kw in self.WANT_TO_EAT:
+            intent, kw, _ = handler.parse_intent(query)
+            assert intent == "want_to_eat", query
+            assert expected_kw in kw, (query, kw)
 
     # UC2 – price_query
     @pytest.mark.parametrize("query,expected_kw", [
@@ -51,6 +59,11 @@ class TestParseIntent:
         intent, _, _ = handler.parse_intent("gợi ý món ăn sáng")
         assert intent == "suggest"
 
+    def test_uppercase_query(self, handler):
+        intent, kw, _ = handler.parse_intent("TÔI MUỐN ĂN PHỞ")
+        assert intent == "want_to_eat"
+        assert kw == "phở"
+
     # unknown
     def test_unknown(self, handler):
         intent, _, _ = handler.parse_intent("hello world")
@@ -95,3 +108,200 @@ class TestFormatPrice:
     ])
     def test_fmt(self, handler, mn, mx, expected):
         assert handler._fmt(mn, mx) == expected
+
+
+class TestFusedIntentRegex:
+    """parse_intent (1 lượt quét) ưu tiên compare > price > want > suggest – cả Hyperscan lẫn regex."""
+
+    CASES = [
+        ("tôi muốn ăn phở",                  ("want_to_eat", "phở", None)),
+        ("so sánh phở với bún chả",          ("price_compare", "phở", "bún")),
+        ("phở giá bao nhiêu",                ("price_query", "phở", None)),
+        ("gợi ý phở giá bao nhiêu",          ("price_query", "gợi ý phở", None)),
+        ("gợi ý món bún chả",                ("suggest", "bún", None)),
+        ("recommend something",              ("suggest", "", None)),
+        ("tôi muốn ăn phở giá bao nhiêu",    ("price_query", "tôi muốn ăn phở", None)),
+        ("so sánh phở vs bún giá bao nhiêu", ("price_compare", "phở", "bún")),
+        ("hello world",                      ("unknown", "hello world", None)),
+        ("",                                 ("unknown", "", None)),
+    ]
+    QUERIES = [q for q, _ in CASES]
+
+    @pytest.mark.parametrize("query,expected", CASES)
+    def test_priority_and_groups(self, handler, query, expected):
+        assert handler.parse_intent(query) == expected
+
+    @pytest.mark.parametrize("query,expected", CASES)
+    def test_regex_fallback_without_hyperscan(self, handler, monkeypatch, query, expected):
+        from api.core import simple
+        monkeypatch.setattr(simple, "_HS", None)
+        handler.clear_cache()
+        assert handler.parse_intent(query) == expected
+        handler.clear_cache()
+
+    UNICODE_SPACE = {
+        "tôi muốn ăn\u00a0phở":             ("want_to_eat", "phở", None),
+        "phở\u2003giá bao nhiêu":            ("price_query", "phở", None),
+        "so sánh\u00a0phở với\u00a0bún chả": ("price_compare", "phở", "bún"),
+        "gợi\u00a0ý món bún":               ("suggest", "bún", None),
+        "hello\u00a0world":                 ("unknown", "hello world", None),
+    }
+
+    @pytest.mark.parametrize("query", [*QUERIES, *UNICODE_SPACE])
+    def test_same_match_under_re_and_re2(self, query):
+        """Pattern intent cho cùng kết quả dưới stdlib re và re2 (query đã _normalize)."""
+        re2 = pytest.importorskip("re2")
+        import re
+        from api.core.simple import _RE_INTENT, _normalize
+        q = _normalize(query)
+
+        def _fused(engine):
+            m = engine.compile(_RE_INTENT.pattern).match(q)
+            return (m.lastgroup, m.groupdict()) if m else None
+        assert _fused(re) == _fused(re2)
+
+    @pytest.mark.parametrize("query,expected", UNICODE_SPACE.items())
+    def test_unicode_whitespace(self, handler, query, expected):
+        assert handler.parse_intent(query) == expected
+
+    @pytest.mark.parametrize("query", ["tôi muốn ăn\u00a0phở", "phở\u2003giá bao nhiêu", "so sánh\u00a0phở với bún"])
+    def test_hyperscan_non_ascii_whitespace(self, query):
+        """Query chưa chuẩn hoá (NBSP...) đi thẳng vào Hyperscan không được crash."""
+        from api.core import simple
+        if simple._HS is None:
+            pytest.skip("hyperscan not installed")
+        assert simple._parse_intent_hs(query) == simple._parse_intent_re(query)
+
+    def test_hyperscan_hit_without_group_match_falls_back(self, monkeypatch):
+        from api.core import simple
+        monkeypatch.setattr(simple, "_hs_intent_id", lambda q: 2)   # báo "want" sai
+        assert simple._parse_intent_hs("hello world") == ("unknown", "hello world", None)
+
+    def test_repeat_query_cached(self, handler):
+        from api.core.simple import _parse_intent_cached
+        handler.clear_cache()
+        handler.parse_intent("Phở giá bao nhiêu")
+        handler.parse_intent("phở giá bao nhiêu  ")
+        info = _parse_intent_cached.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
+
+class TestHandleCached:
+    """handle_cached cache kết quả theo (query, city, bữa ăn)."""
+
+    @pytest.mark.asyncio
+    async def test_same_query_searches_once(self, fresh_handler, sample_items):
+        import asyncio
+        calls = []
+
+        async def _search(kw, limit=10):
+            calls.append(kw)
+            await asyncio.sleep(0.01)
+            return sample_items
+        results = await asyncio.gather(*(
+            fresh_handler.handle_cached("Tôi muốn ăn phở", "ha_noi", _search, 12) for _ in range(5)
+        ))
+        assert calls == ["phở"]
+        assert all(r == results[0] for r in results)
+
+    @pytest.mark.asyncio
+    async def test_key_includes_city_and_meal(self, fresh_handler, mock_search_fn):
+        await fresh_handler.handle_cached("tôi muốn ăn phở", "ha_noi", mock_search_fn, 12)
+        await fresh_handler.handle_cached("tôi muốn ăn phở", "da_nang", mock_search_fn, 12)
+        await fresh_handler.handle_cached("tôi muốn ăn phở", "ha_noi", mock_search_fn, 19)
+        assert len(fresh_handler._results) == 3
+
+    @pytest.mark.asyncio
+    async def test_unhandled_result_cached(self, fresh_handler, mock_search_fn):
+        r1 = await fresh_handler.handle_cached("hello", "ha_noi", mock_search_fn, 12)
+        r2 = await fresh_handler.handle_cached("hello", "ha_noi", mock_search_fn, 12)
+        assert r1 == r2 == ("", [], False)
+        assert len(fresh_handler._results) == 1
+
+
+    @pytest.mark.asyncio
+    async def test_lock_released_on_error(self, fresh_handler):
+        async def _broken(kw, limit=10):
+            raise RuntimeError("search down")
+        with pytest.raises(RuntimeError):
+            await fresh_handler.handle_cached("tôi muốn ăn phở", "ha_noi", _broken, 12)
+        assert fresh_handler._locks == {}
+        assert len(fresh_handler._results) == 0
+
+
+class TestFtsPreference:
+    """Keyword 1 từ dùng fts_fn trước; rỗng hoặc nhiều từ → search_fn."""
+
+    @pytest.mark.asyncio
+    async def test_single_token_uses_fts(self, handler, sample_items, mock_search_fn):
+        used = []
+
+        async def _fts(kw, limit=10):
+            used.append(kw)
+            return sample_items[:1]
+        _, items, _ = await handler.handle("tôi muốn ăn phở", mock_search_fn, 12, _fts)
+        assert used == ["phở"]
+        assert len(items) == 1
+
+    @pytest.mark.asyncio
+    async def test_multi_token_or_empty_fts_falls_back(self, handler, sample_items, mock_search_fn):
+        async def _fts(kw, limit=10):
+            return []
+        _, items, _ = await handler.handle("phở giá bao nhiêu", mock_search_fn, 12, _fts)
+        assert items == sample_items
+        _, items, _ = await handler.handle("tôi muốn ăn bún chả", mock_search_fn, 12, _fts)
+        assert items == sample_items
+
+    @pytest.mark.asyncio
+    async def test_compare_uses_multi_fn(self, handler, sample_items):
+        calls = []
+
+        async def _multi(kws, limit=5):
+            calls.append(kws)
+            return [sample_items[:1], []]
+
+        async def _search(kw, limit=10):
+            calls.append(kw)
+            return sample_items[1:2]
+        _, items, _ = await handler.handle("so sánh phở với bún", _search, 12, None, _multi)
+        assert calls == [["phở", "bún"], "bún"]
+        assert [i.id for i in items] == [1, 2]
+
+
+class TestPriceTemplate:
+    """_resp_price tính khoảng giá 1 lượt, không lỗi khi thiếu gia_min/gia_max."""
+
+    def test_range_from_min_and_max(self, handler):
+        from tests.helpers import make_item
+        text = handler._resp_price("phở", [make_item(gia_min=30000, gia_max=50000),
+                                           make_item(gia_min=40000, gia_max=90000)])
+        assert "*Dao động: 30k–90k đ*" in text
+
+    def test_only_max_price(self, handler):
+        from tests.helpers import make_item
+        text = handler._resp_price("phở", [make_item(gia_min=0, gia_max=60000)])
+        assert "*Dao động: 60k đ*" in text
+
+    def test_max_sentinel_ignored(self, handler):
+        from tests.helpers import make_item
+        text = handler._resp_price("phở", [make_item(gia_min=50000, gia_max=1)])
+        assert "*Dao động: 50k đ*" in text
+        assert "–0k" not in text
+
+
+class TestHandleStream:
+    """handle_stream yield từng đoạn reply, kết thúc bằng (items, handled)."""
+
+    @pytest.mark.asyncio
+    async def test_chunks_rebuild_full_reply(self, handler, sample_items, mock_search_fn):
+        chunks = [c async for c in handler.handle_stream("tôi muốn ăn phở", "ha_noi", mock_search_fn, 12)]
+        *texts, final = chunks
+        full, _, _ = await handler.handle("tôi muốn ăn phở", mock_search_fn, 12)
+        assert "".join(texts) == full
+        assert len(texts) == 1 + len(sample_items)
+        assert final == (sample_items, True)
+
+    @pytest.mark.asyncio
+    async def test_unhandled_yields_only_sentinel(self, handler, mock_search_fn):
+        chunks = [c async for c in handler.handle_stream("hello", "ha_noi", mock_search_fn, 12)]
+        assert chunks == [([], False)]
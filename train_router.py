@@ -0,0 +1,87 @@
+"""
+train_router.py – Train logistic regression cho router_model (chạy offline).
+
+Feature: hash char n-gram của query (router_model.lr_features) → model chỉ là
+W [3, n_features] + b [3], inference = 1 phép cộng cột W, không cần sklearn.
+
+Input là JSONL {"query": "...", "label": "simple|complex|heavy"} (log đã gán nhãn),
+hoặc file text 1 query/dòng kèm --label-with-regex để lấy nhãn từ router regex.
+
+  python train_router.py logs/labeled.jsonl
+  python train_router.py queries.txt --label-with-regex --out data/router_lr.npz
+
+router_model tự load file ở ROUTER_MODEL_PATH (mặc định ./data/router_lr.npz).
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from api.router_model import LR_FEATURES, LR_NGRAMS, LR_TIERS, ROUTER_MODEL_PATH, _route_regex, lr_features
+
+
+def load_dataset(path: Path, label_with_regex: bool) -> tuple[list[str], np.ndarray]:
+    queries, labels = [], []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        if label_with_regex:
+            q = line.strip().lower()
+            label = _route_regex(q, has_location=False).query_type
+        else:
+            row = json.loads(line)
+            q, label = row["query"].strip().lower(), row["label"]
+        queries.append(q)
+        labels.append(LR_TIERS.index(label))
+    return queries, np.array(labels, dtype=np.int64)
+
+
+def train(
+    feats: list[np.ndarray], y: np.ndarray, n_features: int,
+    epochs: int, lr: float, l2: float, batch: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Softmax regression, mini-batch gradient descent trên ma trận đếm n-gram."""
+    n_classes = len(LR_TIERS)
+    W = np.zeros((n_classes, n_features), dtype=np.float32)
+    b = np.zeros(n_classes, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    for _ in range(epochs):
+        order = rng.permutation(len(feats))
+        for start in range(0, len(order), batch):
+            rows = order[start:start + batch]
+            X = np.zeros((len(rows), n_features), dtype=np.float32)
+            for i, r in enumerate(rows):
+                np.add.at(X[i], feats[r], 1.0)
+            logits = X @ W.T + b
+            p = np.exp(logits - logits.max(axis=1, keepdims=True))
+            p /= p.sum(axis=1, keepdims=True)
+            p[np.arange(len(rows)), y[rows]] -= 1.0
+            W -= lr * (p.T @ X / len(rows) + l2 * W)
+            b -= lr * p.mean(axis=0)
+    return W, b
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", type=Path)
+    parser.add_argument("--label-with-regex", action="store_true")
+    parser.add_argument("--out", default=ROUTER_MODEL_PATH)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    queries, y = load_dataset(args.data, args.label_with_regex)
+    feats = [lr_features(q, LR_FEATURES, LR_NGRAMS) for q in queries]
+    W, b = train(feats, y, LR_FEATURES, args.epochs, args.lr, args.l2, args.batch)
+
+    pred = np.array([int((b + W[:, f].sum(axis=1)).argmax()) for f in feats])
+    print(f"[ok]   {len(queries)} queries, train accuracy {np.mean(pred == y):.3f}")
+    np.savez_compressed(args.out, W=W, b=b, ngrams=np.array(LR_NGRAMS))
+    print(f"[ok]   → {args.out}")
+
+
+if __name__ == "__main__":
+    main()